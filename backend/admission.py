@@ -0,0 +1,116 @@
+import asyncio
+import time
+from typing import Dict, List
+
+
+class Rejected(Exception):
+    """A request turned away before any work was done; code and retry_after go back to the client"""
+
+    def __init__(self, code: str, message: str, retry_after: float):
+        super().__init__(message)
+        self.code = code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> float:
+        """Take a token; returns 0 on success, otherwise the seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Global cap on concurrent queries with a bounded wait queue; overflow is rejected immediately"""
+
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 64, queue_timeout: float = 30.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        """Take a query slot, waiting in the bounded queue when all slots are busy"""
+        if self.semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Rejected("busy", "Server busy, retry later", self.retry_after())
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout or None)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Rejected("busy", "Server busy, timed out waiting in queue", self.retry_after())
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self.semaphore.release()
+
+    def retry_after(self) -> float:
+        """Rough hint for clients: one second per full round of queued work"""
+        return round(1.0 + self.waiting / max(self.max_concurrent, 1), 1)
+
+
+class ConversationLocks:
+    """Per-conversation locks that exist only while a query holds or waits for them
+
+    Conversation ids are chosen by clients, so waiters per conversation are capped and bounded in time;
+    overflow is rejected as busy like the admission queue.
+    """
+
+    def __init__(self, max_waiters: int = 8, timeout: float = 30.0):
+        self.max_waiters = max_waiters
+        self.timeout = timeout
+        # conversation id -> [lock, queries holding or waiting for it]
+        self.locks: Dict[str, List] = {}
+
+    async def acquire(self, conversation_id: str):
+        """Take the conversation's lock, waiting behind earlier queries of the same conversation"""
+        entry = self.locks.setdefault(conversation_id, [asyncio.Lock(), 0])
+        lock = entry[0]
+        if lock.locked() and entry[1] > self.max_waiters:
+            raise Rejected("busy", "Too many queries waiting on this conversation", 1.0)
+        entry[1] += 1
+        try:
+            if lock.locked():
+                try:
+                    await asyncio.wait_for(lock.acquire(), timeout=self.timeout or None)
+                except asyncio.TimeoutError:
+                    raise Rejected("busy", "Timed out waiting for an earlier query of this conversation", 1.0)
+            else:
+                await lock.acquire()
+        except BaseException:
+            self._drop(conversation_id, entry)
+            raise
+
+    def release(self, conversation_id: str):
+        entry = self.locks[conversation_id]
+        entry[0].release()
+        self._drop(conversation_id, entry)
+
+    def _drop(self, conversation_id: str, entry: List):
+        entry[1] -= 1
+        if not entry[1]:
+            del self.locks[conversation_id]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List
+
+log = logging.getLogger("gateway.batch")
+
+BATCH_MODES = ("agent", "message_batches")
+
+
+def load_batch_items(request: Dict[str, Any], batch_dir: str = None, max_items: int = 10000) -> List[Dict[str, Any]]:
+    """Items of a batch request, from its inline `queries` or a JSONL `path` inside batch_dir"""
+    if "queries" in request:
+        entries = request["queries"]
+        if not isinstance(entries, list):
+            raise ValueError("queries must be a list")
+        source = "queries"
+    elif "path" in request:
+        entries = read_jsonl(resolve_batch_path(request["path"], batch_dir), max_items)
+        source = request["path"]
+    else:
+        raise ValueError("A batch request needs queries or path")
+
+    if len(entries) > max_items:
+        raise ValueError(f"Batch has more than {max_items} items")
+
+    items = []
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {"query": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("query"), str):
+            raise ValueError(f"Item {index} of {source} has no query string")
+        items.append({
+            "index": index,
+            "custom_id": str(entry.get("custom_id", index)),
+            "query": entry["query"],
+            "server": entry.get("server")
+        })
+    return items
+
+
+def resolve_batch_path(path: Any, batch_dir: str = None) -> str:
+    """Resolve a client-supplied file name, refusing anything outside batch_dir"""
+    if not batch_dir:
+        raise ValueError("Batch files are disabled; set BATCH_DIR on the gateway")
+    if not isinstance(path, str) or not path:
+        raise ValueError("path must be a non-empty string")
+    root = os.path.realpath(batch_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError("path must be inside BATCH_DIR")
+    return resolved
+
+
+def read_jsonl(path: str, max_items: int) -> List[Any]:
+    """Parse one JSON value per non-empty line, stopping just past max_items"""
+    entries = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Line {number} of {os.path.basename(path)} is not valid JSON: {e.msg}")
+                if len(entries) > max_items:
+                    break
+    except OSError as e:
+        raise ValueError(f"Cannot read batch file: {e.strerror}")
+    return entries
+
+
+async def run_message_batch(anthropic, items: List[Dict[str, Any]], params: Dict[str, Any], poll_interval: float,
+                            report: Callable[[Dict[str, Any], str, str], Awaitable[None]]):
+    """Submit items as one Message Batches job and report each result once the job has ended
+
+    Batch jobs answer each query in a single model turn, so no tools are offered.
+    """
+    requests = [
+        {"custom_id": f"item-{item['index']}", "params": dict(params, messages=[{"role": "user", "content": item["query"]}])}
+        for item in items
+    ]
+    batch = await anthropic.messages.batches.create(requests=requests)
+    log.info("Submitted message batch %s with %s requests", batch.id, len(requests))
+    try:
+        while batch.processing_status != "ended":
+            await asyncio.sleep(poll_interval)
+            batch = await anthropic.messages.batches.retrieve(batch.id)
+    except asyncio.CancelledError:
+        # The client went away; stop paying for work nobody will read
+        await asyncio.shield(anthropic.messages.batches.cancel(batch.id))
+        raise
+
+    by_id = {request["custom_id"]: item for request, item in zip(requests, items)}
+    async for entry in await anthropic.messages.batches.results(batch.id):
+        item = by_id.pop(entry.custom_id, None)
+        if item is None:
+            continue
+        result = entry.result
+        if result.type == "succeeded":
+            text = "\n".join(block.text for block in result.message.content if block.type == "text")
+            await report(item, "success", text)
+        else:
+            error = getattr(getattr(result, "error", None), "error", None)
+            await report(item, "error", getattr(error, "message", None) or f"Batch request {result.type}")
+    for item in by_id.values():
+        await report(item, "error", "Missing from batch results")
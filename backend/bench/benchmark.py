@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fastmcp import Client
+
+from stub_model_server import StubModelServer
+
+STUB_SERVER = os.path.join(BENCH_DIR, "stub_mcp_server.py")
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_http_server(port: int, tool_latency: float, timeout: float) -> subprocess.Popen:
+    """Start the stub MCP server over streamable-http and wait until it lists its tools"""
+    server = subprocess.Popen([sys.executable, STUB_SERVER, "--transport", "streamable-http", "--port", str(port),
+                               "--tool-latency", str(tool_latency)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with Client(f"http://127.0.0.1:{port}/mcp") as client:
+                await client.list_tools()
+                return server
+        except Exception:
+            if server.poll() is not None or time.monotonic() > deadline:
+                server.terminate()
+                raise RuntimeError("stub MCP server did not start")
+            await asyncio.sleep(0.2)
+
+
+async def client_loop(port: int, client_id: int, requests: int, latencies, failures):
+    """One TCP client sending queries back to back on a single connection"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for i in range(requests):
+            started = time.perf_counter()
+            writer.write((json.dumps({"query": f"client {client_id} query {i}"}) + "\n").encode("utf-8"))
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            if response.get("status") == "success" and not str(response.get("data", "")).startswith("Error"):
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures.append(response.get("code") or response.get("error") or response.get("data"))
+    finally:
+        writer.close()
+
+
+def stage_breakdown(gateway, requests: int):
+    """Mean seconds per request spent in each stage, from the gateway's histograms"""
+    stages = {}
+
+    def add(name, series):
+        totals = stages.setdefault(name, [0.0, 0])
+        totals[0] += series[-2]
+        totals[1] += series[-1]
+
+    for (stage,), series in gateway.stage_seconds.series.items():
+        add(stage, series)
+    for series in gateway.model_queue_seconds.series.values():
+        add("model_queue", series)
+    for series in gateway.model_seconds.series.values():
+        add("model", series)
+    for series in gateway.tool_seconds.series.values():
+        add("tool", series)
+    return {name: (seconds / max(requests, 1), count / max(requests, 1)) for name, (seconds, count) in stages.items()}
+
+
+async def run_transport(transport: str, args) -> dict:
+    from client import UnifiedMCPClient
+
+    gateway = UnifiedMCPClient(tcp_port=0, max_model_calls=args.max_model_calls)
+    server = None
+    try:
+        if transport == "stdio":
+            await gateway.connect_to_local_server("stub", f"{STUB_SERVER} --tool-latency {args.tool_latency}")
+        else:
+            port = free_port()
+            server = await start_http_server(port, args.tool_latency, args.startup_timeout)
+            await gateway.connect_to_remote_server("stub", f"http://127.0.0.1:{port}/mcp")
+        await gateway.start_tcp_server()
+        tcp_port = gateway.tcp_server.sockets[0].getsockname()[1]
+
+        if args.warmup:
+            await asyncio.gather(*(client_loop(tcp_port, -i - 1, args.warmup, [], []) for i in range(args.clients)))
+            for histogram in (gateway.stage_seconds, gateway.model_queue_seconds, gateway.model_seconds, gateway.tool_seconds):
+                histogram.series.clear()
+
+        latencies, failures = [], []
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(tcp_port, i, args.requests, latencies, failures) for i in range(args.clients)))
+        elapsed = time.perf_counter() - started
+        return {
+            "transport": transport,
+            "requests": len(latencies) + len(failures),
+            "failures": len(failures),
+            "throughput": len(latencies) / elapsed,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "stages": stage_breakdown(gateway, len(latencies) + len(failures)),
+        }
+    finally:
+        await gateway.cleanup()
+        if server:
+            server.terminate()
+            server.wait()
+
+
+def print_result(result: dict):
+    print(f"\n[{result['transport']}] {result['requests']} requests, {result['failures']} failed, "
+          f"{result['throughput']:.1f} req/s")
+    print(f"  latency ms: p50 {result['p50'] * 1000:.1f}  p95 {result['p95'] * 1000:.1f}  p99 {result['p99'] * 1000:.1f}")
+    print(f"  {'stage':<18} {'ms/request':>10} {'calls/request':>13}")
+    for stage, (seconds, calls) in sorted(result["stages"].items(), key=lambda item: -item[1][0]):
+        print(f"  {stage:<18} {seconds * 1000:>10.2f} {calls:>13.2f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Offline gateway benchmark against stub MCP servers and a stub model")
+    parser.add_argument("--transports", default="stdio,streamable-http", help="Comma separated: stdio, streamable-http")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent TCP clients")
+    parser.add_argument("--requests", type=int, default=20, help="Queries per client")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured queries per client before the run")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub model latency per call (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Model latency spread as a fraction of latency")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="Model calls per query that ask for tools")
+    parser.add_argument("--tool-calls", type=int, default=1, help="Parallel tool_use blocks per tool round")
+    parser.add_argument("--tool-latency", type=float, default=0.01, help="Stub tool latency per call (seconds)")
+    parser.add_argument("--max-model-calls", type=int, default=64)
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    model = StubModelServer(latency=args.latency, jitter=args.jitter,
+                            tool_rounds=args.tool_rounds, tool_calls=args.tool_calls)
+    await model.start()
+    os.environ["ANTHROPIC_BASE_URL"] = model.url
+    os.environ.setdefault("ANTHROPIC_API_KEY", "stub")
+    # The benchmark is the only client; nothing should be turned away
+    os.environ["CLIENT_RATE_LIMIT"] = "0"
+    os.environ.setdefault("MAX_CONCURRENT_QUERIES", str(args.clients))
+    # An empty path disables the tool cache; never point it at a device the cache would replace
+    os.environ["TOOL_CACHE_PATH"] = ""
+
+    print(f"{args.clients} clients x {args.requests} queries, model {args.latency}s +/-{args.jitter:.0%}, "
+          f"{args.tool_rounds} tool round(s) x {args.tool_calls} call(s) of {args.tool_latency}s")
+    results = []
+    try:
+        for transport in args.transports.split(","):
+            result = await run_transport(transport.strip(), args)
+            print_result(result)
+            results.append(result)
+    finally:
+        await model.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
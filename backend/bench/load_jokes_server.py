@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+
+from fastmcp import Client
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+JOKES_DIR = os.path.join(os.path.dirname(BENCH_DIR), "servers", "cloud-mcp-jokes")
+
+from stub_model_server import StubModelServer
+
+
+class JokeModel(StubModelServer):
+    """Stub model that answers every call with fresh jokes so the server's de-duplication keeps them"""
+
+    def __init__(self, latency: float):
+        super().__init__(latency=latency)
+        self.jokes = itertools.count(1)
+
+    async def route(self, method, path, payload):
+        if method == "POST" and path == "/v1/messages":
+            text = "\n".join(f"Stub joke number {next(self.jokes)}." for _ in range(5))
+            return "200 OK", await self.respond(payload, [{"type": "text", "text": text}])
+        return await super().route(method, path, payload)
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+async def wait_until_ready(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with Client(url) as client:
+                await client.list_tools()
+                return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.5)
+
+
+async def client_loop(url: str, categories, deadline: float, latencies, errors):
+    """One MCP session calling tell_joke back to back until the deadline"""
+    async with Client(url) as client:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                await client.call_tool("tell_joke", {"category": random.choice(categories)})
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors.append(1)
+
+
+async def run_workers(workers: int, model: JokeModel, args):
+    env = dict(
+        os.environ,
+        ANTHROPIC_BASE_URL=model.url,
+        ANTHROPIC_API_KEY="stub",
+        PORT=str(args.port),
+        WORKERS=str(workers),
+    )
+    server = subprocess.Popen(shlex.split(args.server_cmd), cwd=JOKES_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{args.port}/mcp"
+    try:
+        await wait_until_ready(url, args.startup_timeout)
+        first_request = model.requests
+        categories = [f"topic {i}" for i in range(args.categories)]
+        latencies, errors = [], []
+        started = time.monotonic()
+        await asyncio.gather(*(
+            client_loop(url, categories, started + args.duration, latencies, errors) for _ in range(args.clients)
+        ))
+        elapsed = time.monotonic() - started
+        return len(latencies) / elapsed, len(errors), percentile(latencies, 0.5), percentile(latencies, 0.99), model.requests - first_request
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load-test the jokes MCP server against a stub model")
+    parser.add_argument("--workers", default="1,2,4", help="Comma separated WORKERS values to compare")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent MCP sessions")
+    parser.add_argument("--categories", type=int, default=20, help="Distinct joke categories requested")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per run")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub model latency per call (seconds)")
+    parser.add_argument("--port", type=int, default=8095)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--server-cmd", default=f"{shlex.quote(sys.executable)} server.py",
+                        help="Command starting the server, run from the server directory (e.g. 'uv run server.py')")
+    args = parser.parse_args()
+
+    model = JokeModel(args.latency)
+    await model.start()
+    print(f"{args.clients} sessions, {args.categories} categories, stub model latency {args.latency}s")
+    print(f"\n{'workers':>7} {'req/s':>8} {'errors':>6} {'p50 ms':>8} {'p99 ms':>8} {'model calls':>11}")
+    try:
+        for workers in (int(value) for value in args.workers.split(",")):
+            rps, errors, p50, p99, model_calls = await run_workers(workers, model, args)
+            print(f"{workers:>7} {rps:>8.1f} {errors:>6} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f} {model_calls:>11}")
+    finally:
+        await model.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
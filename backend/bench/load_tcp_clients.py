@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stub_model_server import StubModelServer
+
+
+async def send_query(port: int, query: str) -> dict:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write((json.dumps({"query": query}) + "\n").encode("utf-8"))
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def timed_round(port: int, clients: int) -> float:
+    start = time.perf_counter()
+    results = await asyncio.gather(*(send_query(port, f"query {i}") for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    failed = [r for r in results if r.get("status") != "success"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} requests failed: {failed[0]}")
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Concurrent TCP clients against the gateway with a stub model")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub model latency per call (seconds)")
+    parser.add_argument("--max-model-calls", type=int, default=64)
+    args = parser.parse_args()
+
+    model = StubModelServer(latency=args.latency)
+    await model.start()
+    os.environ["ANTHROPIC_BASE_URL"] = model.url
+    os.environ.setdefault("ANTHROPIC_API_KEY", "stub")
+    # Keep the gateway from writing a tool cache into the caller's directory
+    os.environ["TOOL_CACHE_PATH"] = ""
+
+    from client import UnifiedMCPClient
+
+    gateway = UnifiedMCPClient(tcp_port=0, max_model_calls=args.max_model_calls)
+    try:
+        await gateway.connect_to_local_server("stub", os.path.join(BENCH_DIR, "stub_mcp_server.py"))
+        await gateway.start_tcp_server()
+        port = gateway.tcp_server.sockets[0].getsockname()[1]
+
+        single = await timed_round(port, 1)
+        concurrent = await timed_round(port, args.clients)
+
+        print(f"\n1 client:            {single:.3f}s")
+        print(f"{args.clients} concurrent clients: {concurrent:.3f}s")
+        print(f"ratio:               {concurrent / single:.2f}x (1.0 = fully concurrent, {args.clients} = serialized)")
+        print(f"model requests:      {model.requests}")
+    finally:
+        await gateway.cleanup()
+        await model.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
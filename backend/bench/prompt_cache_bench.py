@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stub_model_server import StubModelServer
+
+
+async def run_conversation(model: StubModelServer, prompt_caching: bool, turns: int):
+    from client import UnifiedMCPClient
+
+    gateway = UnifiedMCPClient(prompt_caching=prompt_caching)
+    rows = []
+    try:
+        await gateway.connect_to_local_server("stub", os.path.join(BENCH_DIR, "stub_mcp_server.py"))
+        for turn in range(1, turns + 1):
+            first = len(model.request_log)
+            await gateway.process_query(f"Turn {turn}: tell me something new about the repository.", "bench")
+            for entry in model.request_log[first:]:
+                rows.append((turn, entry["bytes"], entry["usage"]))
+    finally:
+        await gateway.cleanup()
+    return rows
+
+
+def print_rows(title: str, rows):
+    print(f"\n{title}")
+    print(f"{'turn':>4} {'bytes sent':>10} {'input':>8} {'cache read':>10} {'cache write':>11}")
+    for turn, sent, usage in rows:
+        print(f"{turn:>4} {sent:>10} {usage['input_tokens']:>8} "
+              f"{usage['cache_read_input_tokens']:>10} {usage['cache_creation_input_tokens']:>11}")
+    billed = sum(u["input_tokens"] + u["cache_creation_input_tokens"] for _, _, u in rows)
+    print(f"uncached input tokens across the conversation: {billed}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare per-turn payloads with and without prompt caching")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--reply-words", type=int, default=200, help="Length of each stub reply")
+    args = parser.parse_args()
+
+    reply = " ".join(f"word{i}" for i in range(args.reply_words))
+    model = StubModelServer(latency=0.0, reply=reply)
+    await model.start()
+    os.environ["ANTHROPIC_BASE_URL"] = model.url
+    os.environ.setdefault("ANTHROPIC_API_KEY", "stub")
+    # Keep the gateway from writing a tool cache into the caller's directory
+    os.environ["TOOL_CACHE_PATH"] = ""
+
+    try:
+        for prompt_caching in (False, True):
+            model.prompt_cache.clear()
+            rows = await run_conversation(model, prompt_caching, args.turns)
+            print_rows(f"prompt caching {'on' if prompt_caching else 'off'}", rows)
+    finally:
+        await model.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stub_model_server import StubModelServer
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+async def send_query(port: int, query: str):
+    """Send one query on its own connection; returns (status or code, latency)"""
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError:
+        return "connect_failed", time.perf_counter() - started
+    try:
+        writer.write((json.dumps({"query": query}) + "\n").encode("utf-8"))
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        return response.get("code") or response["status"], time.perf_counter() - started
+    except (ConnectionError, ValueError):
+        return "connection_error", time.perf_counter() - started
+    finally:
+        writer.close()
+
+
+async def offer_load(port: int, rate: float, duration: float):
+    """Open-loop load: start queries at Poisson arrivals regardless of how fast they complete"""
+    tasks = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        tasks.append(asyncio.create_task(send_query(port, f"query {len(tasks)}")))
+        await asyncio.sleep(random.expovariate(rate))
+    return await asyncio.gather(*tasks)
+
+
+async def run_level(admission: bool, rate: float, args):
+    from client import UnifiedMCPClient
+
+    os.environ["MAX_CONCURRENT_QUERIES"] = str(args.concurrency if admission else 100_000)
+    os.environ["MAX_QUEUED_QUERIES"] = str(args.queue if admission else 100_000)
+    os.environ["MAX_TCP_CONNECTIONS"] = "100000"
+    os.environ["CLIENT_RATE_LIMIT"] = "0"
+
+    gateway = UnifiedMCPClient(tcp_port=0, max_model_calls=args.concurrency)
+    try:
+        await gateway.connect_to_local_server("stub", os.path.join(BENCH_DIR, "stub_mcp_server.py"))
+        await gateway.start_tcp_server()
+        port = gateway.tcp_server.sockets[0].getsockname()[1]
+        results = await offer_load(port, rate, args.duration)
+    finally:
+        await gateway.cleanup()
+
+    latencies = [latency for status, latency in results if status == "success"]
+    rejected = sum(1 for status, _ in results if status == "busy")
+    failed = len(results) - len(latencies) - rejected
+    return len(results), len(latencies), rejected, failed, percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Overload the gateway and compare p99 latency with and without admission control")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub model latency per call (seconds)")
+    parser.add_argument("--concurrency", type=int, default=8, help="MAX_CONCURRENT_QUERIES and model call slots")
+    parser.add_argument("--queue", type=int, default=8, help="MAX_QUEUED_QUERIES")
+    parser.add_argument("--loads", default="0.5,1,2,4", help="Offered load as multiples of capacity")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds of load per level")
+    args = parser.parse_args()
+
+    model = StubModelServer(latency=args.latency)
+    await model.start()
+    os.environ["ANTHROPIC_BASE_URL"] = model.url
+    os.environ.setdefault("ANTHROPIC_API_KEY", "stub")
+    # Keep the gateway from writing a tool cache into the caller's directory
+    os.environ["TOOL_CACHE_PATH"] = ""
+
+    capacity = args.concurrency / args.latency
+    print(f"capacity ~{capacity:.0f} queries/s ({args.concurrency} slots x {args.latency}s model latency)")
+    print(f"\n{'mode':>10} {'load':>5} {'offered/s':>9} {'sent':>6} {'ok':>6} {'busy':>6} {'failed':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    try:
+        for load in (float(value) for value in args.loads.split(",")):
+            for admission in (True, False):
+                sent, ok, rejected, failed, p50, p99 = await run_level(admission, load * capacity, args)
+                mode = "admission" if admission else "unbounded"
+                print(f"{mode:>10} {load:>5.1f} {load * capacity:>9.0f} {sent:>6} {ok:>6} {rejected:>6} {failed:>6} "
+                      f"{p50 * 1000:>8.0f} {p99 * 1000:>8.0f}")
+    finally:
+        await model.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
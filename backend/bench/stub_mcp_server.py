@@ -0,0 +1,30 @@
+import argparse
+import asyncio
+
+from fastmcp import FastMCP
+
+mcp = FastMCP("Stub MCP server")
+
+# Simulated work per tool call, set with --tool-latency
+tool_latency = 0.0
+
+@mcp.tool()
+async def echo(text: str) -> str:
+    """Echo the given text back."""
+    if tool_latency:
+        await asyncio.sleep(tool_latency)
+    return text
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub MCP server with an echo tool")
+    parser.add_argument("--transport", choices=["stdio", "streamable-http"], default="stdio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="Seconds each tool call takes")
+    args = parser.parse_args()
+    tool_latency = args.tool_latency
+
+    if args.transport == "stdio":
+        mcp.run(show_banner=False)
+    else:
+        mcp.run(transport="streamable-http", host=args.host, port=args.port, show_banner=False)
@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import itertools
+import random
+from typing import Any, Dict, List, Optional
+
+
+class StubModelServer:
+    """Minimal local stand-in for the Anthropic Messages API"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.5, reply: str = "Stub reply.",
+                 jitter: float = 0.0, tool_rounds: int = 0, tool_calls: int = 1, tool_name: str = "echo"):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.reply = reply
+        self.tool_rounds = tool_rounds
+        self.tool_calls = tool_calls
+        self.tool_name = tool_name
+        self.server = None
+        self.requests = 0
+        self.bytes_received = 0
+        self.request_log: List[Dict[str, Any]] = []
+        self.prompt_cache = set()
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = b""
+                length = int(headers.get("content-length", 0))
+                if length:
+                    body = await reader.readexactly(length)
+
+                self.requests += 1
+                self.bytes_received += len(request_line) + length
+                payload = json.loads(body) if body else {}
+                self.request_log.append({"path": path, "bytes": length, "payload": payload})
+
+                status, response = await self.route(method, path.split("?")[0], payload)
+                if isinstance(response, list):
+                    await self.write_event_stream(writer, status, response)
+                    continue
+
+                if isinstance(response, bytes):
+                    data, content_type = response, "application/x-jsonl"
+                else:
+                    data, content_type = json.dumps(response).encode("utf-8"), "application/json"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    f"content-type: {content_type}\r\n"
+                    f"content-length: {len(data)}\r\n"
+                    f"request-id: req_stub_{self.requests}\r\n"
+                    f"\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def write_event_stream(self, writer, status: str, events: List[tuple]):
+        """Send (delay, event, data) tuples as a chunked server-sent event stream"""
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"content-type: text/event-stream\r\n"
+            f"transfer-encoding: chunked\r\n"
+            f"request-id: req_stub_{self.requests}\r\n"
+            f"\r\n".encode("latin-1")
+        )
+        for delay, event, data in events:
+            if delay:
+                await asyncio.sleep(delay)
+            chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+            writer.write(f"{len(chunk):x}\r\n".encode("latin-1") + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def route(self, method: str, path: str, payload: Dict[str, Any]):
+        if method == "POST" and path == "/v1/messages":
+            return "200 OK", await self.respond(payload, self.tool_use_content(payload))
+        if path.startswith("/v1/messages/batches"):
+            response = self.route_batch(method, path[len("/v1/messages/batches"):].strip("/").split("/"), payload)
+            if response is not None:
+                return "200 OK", response
+        return "404 Not Found", {"type": "error", "error": {"type": "not_found_error", "message": path}}
+
+    async def respond(self, payload: Dict[str, Any], content: Optional[List[Dict[str, Any]]] = None):
+        """Reply to a Messages API call, as one JSON body or as stream events"""
+        message = self.build_message(payload, content)
+        if payload.get("stream"):
+            return self.stream_events(message)
+        await asyncio.sleep(self.delay())
+        return message
+
+    def route_batch(self, method: str, parts: List[str], payload: Dict[str, Any]):
+        """Message Batches API: a batch ends `latency` seconds after it was created"""
+        if method == "POST" and parts == [""]:
+            batch_id = f"msgbatch_stub_{next(self._ids)}"
+            self.batches[batch_id] = {
+                "created": asyncio.get_running_loop().time(),
+                "requests": payload.get("requests", []),
+                "canceled": False,
+            }
+            return self.batch_status(batch_id)
+        batch_id = parts[0]
+        if batch_id not in self.batches:
+            return None
+        if method == "GET" and len(parts) == 1:
+            return self.batch_status(batch_id)
+        if method == "POST" and parts[1:] == ["cancel"]:
+            self.batches[batch_id]["canceled"] = True
+            return self.batch_status(batch_id)
+        if method == "GET" and parts[1:] == ["results"]:
+            batch = self.batches[batch_id]
+            lines = []
+            for request in batch["requests"]:
+                if batch["canceled"]:
+                    result = {"type": "canceled"}
+                else:
+                    result = {"type": "succeeded", "message": self.build_message(request["params"], self.tool_use_content(request["params"]))}
+                lines.append(json.dumps({"custom_id": request["custom_id"], "result": result}))
+            return ("\n".join(lines) + "\n").encode("utf-8")
+        return None
+
+    def batch_status(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.batches[batch_id]
+        count = len(batch["requests"])
+        ended = batch["canceled"] or asyncio.get_running_loop().time() - batch["created"] >= self.latency
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended and not batch["canceled"] else 0,
+                "errored": 0,
+                "canceled": count if batch["canceled"] else 0,
+                "expired": 0,
+            },
+            "created_at": "2024-01-01T00:00:00Z",
+            "expires_at": "2024-01-02T00:00:00Z",
+            "ended_at": "2024-01-01T00:00:01Z" if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def delay(self) -> float:
+        """Latency of one call, spread uniformly by +/- jitter (a fraction of latency)"""
+        return self.latency * random.uniform(1 - self.jitter, 1 + self.jitter) if self.jitter else self.latency
+
+    def tool_use_content(self, payload: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Ask for tool calls on the first `tool_rounds` model calls of a turn, when the request offers tools"""
+        tools = payload.get("tools") or []
+        if self.tool_rounds <= 0 or not tools:
+            return None
+
+        rounds = 0
+        for message in reversed(payload.get("messages", [])):
+            content = message["content"]
+            if message["role"] != "user":
+                continue
+            if isinstance(content, str) or any(block.get("type") != "tool_result" for block in content):
+                break
+            rounds += 1
+        if rounds >= self.tool_rounds:
+            return None
+
+        # Namespaced tools end in the original name, so match on the suffix
+        tool = next((tool for tool in tools if tool["name"].endswith(self.tool_name)), tools[0])
+        return [
+            {"type": "tool_use", "id": f"toolu_stub_{next(self._ids)}", "name": tool["name"], "input": {"text": f"call {i}"}}
+            for i in range(self.tool_calls)
+        ]
+
+    def stream_events(self, message: Dict[str, Any]) -> List[tuple]:
+        """Split a message into stream events spread evenly over the configured latency"""
+        deltas = []
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                words = block["text"].split(" ")
+                start = dict(block, text="")
+                parts = [{"type": "text_delta", "text": word if i == 0 else " " + word} for i, word in enumerate(words)]
+            else:
+                start = dict(block, input={})
+                parts = [{"type": "input_json_delta", "partial_json": json.dumps(block["input"])}]
+            deltas.append(("content_block_start", {"type": "content_block_start", "index": index, "content_block": start}))
+            deltas.extend(("content_block_delta", {"type": "content_block_delta", "index": index, "delta": part}) for part in parts)
+            deltas.append(("content_block_stop", {"type": "content_block_stop", "index": index}))
+
+        step = self.latency / (sum(1 for name, _ in deltas if name == "content_block_delta") + 1)
+        usage = message["usage"]
+        events = [(step, "message_start", {"type": "message_start", "message": dict(message, content=[], stop_reason=None, usage=dict(usage, output_tokens=0))})]
+        events.extend((step if name == "content_block_delta" else 0, name, data) for name, data in deltas)
+        events.append((0, "message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+            "usage": {"output_tokens": usage["output_tokens"]},
+        }))
+        events.append((0, "message_stop", {"type": "message_stop"}))
+        return events
+
+    def prompt_segments(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Flatten tools, system and message blocks in the order the prompt cache sees them"""
+        segments = list(payload.get("tools", []))
+        system = payload.get("system", [])
+        segments.extend([{"type": "text", "text": system}] if isinstance(system, str) else system)
+        for message in payload.get("messages", []):
+            content = message["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            segments.extend(dict(block, _role=message["role"]) for block in content)
+        return segments
+
+    def usage_for(self, payload: Dict[str, Any]) -> Dict[str, int]:
+        """Estimate token usage, simulating prompt cache reads and writes at cache_control breakpoints"""
+        digest = hashlib.sha256()
+        size = 0
+        cache_read = 0
+        cache_write = 0
+        for segment in self.prompt_segments(payload):
+            marked = "cache_control" in segment
+            data = json.dumps({k: v for k, v in segment.items() if k != "cache_control"}, sort_keys=True)
+            digest.update(data.encode("utf-8"))
+            size += len(data)
+            key = digest.hexdigest()
+            if key in self.prompt_cache:
+                cache_read = size
+            elif marked:
+                self.prompt_cache.add(key)
+                cache_write = size
+
+        cache_write = max(cache_write - cache_read, 0)
+        return {
+            "input_tokens": max(size - cache_read - cache_write, 0) // 4,
+            "cache_read_input_tokens": cache_read // 4,
+            "cache_creation_input_tokens": cache_write // 4,
+        }
+
+    def build_message(self, payload: Dict[str, Any], content: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        if content is None:
+            content = [{"type": "text", "text": self.reply}]
+        usage = self.usage_for(payload)
+        usage["output_tokens"] = sum(len(block.get("text", "")) for block in content) // 4
+        if self.request_log:
+            self.request_log[-1]["usage"] = usage
+        return {
+            "id": f"msg_stub_{next(self._ids)}",
+            "type": "message",
+            "role": "assistant",
+            "model": payload.get("model", "stub"),
+            "content": content,
+            "stop_reason": "tool_use" if any(block["type"] == "tool_use" for block in content) else "end_turn",
+            "stop_sequence": None,
+            "usage": usage,
+        }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0, help="Spread of latency as a fraction, e.g. 0.2 for +/-20%%")
+    parser.add_argument("--tool-rounds", type=int, default=0, help="Model calls per turn that ask for tools")
+    parser.add_argument("--tool-calls", type=int, default=1, help="tool_use blocks per tool round")
+    args = parser.parse_args()
+
+    server = StubModelServer(args.host, args.port, args.latency, jitter=args.jitter,
+                             tool_rounds=args.tool_rounds, tool_calls=args.tool_calls)
+    await server.start()
+    print(f"Stub model server listening on {server.url} (latency {args.latency}s)")
+    await server.server.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
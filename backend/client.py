@@ -1,33 +1,275 @@
 import asyncio
+import logging
+import os
+import signal
 import sys
+import threading
 import json
-from typing import Optional, List, Dict, Any, Union
+import itertools
+import time
+from typing import Optional, List, Dict, Any, Union, Callable, Awaitable, Tuple
 from contextlib import AsyncExitStack
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+import mcp.types as mcp_types
 
 from fastmcp import Client as FastMCPClient
 
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from dotenv import load_dotenv
 
+from tool_catalog import BUILTIN_SERVER, ToolCatalog, load_tool_cache, save_tool_cache, tool_from_dict
+from conversation_store import ConversationStore
+from supervisor import ConnectionSupervisor
+from tool_result_cache import ToolResultCache, parse_cacheable_tools
+from tool_results import (READ_RESULT_TOOL, READ_RESULT_TOOL_SPEC, ToolResultNormalizer, ToolResultStore,
+                          mentions_stored_result, parse_result_limits)
+from metrics import MetricsRegistry, start_metrics_server, start_trace, timed
+from logging_config import setup_logging
+from admission import AdmissionController, ConversationLocks, Rejected, TokenBucket
+from batch import BATCH_MODES, load_batch_items, run_message_batch
+from routing import ModelRouter, load_routing_policy, referenced_tools
+
 load_dotenv()
 
+log = logging.getLogger("gateway")
+
+DEFAULT_MODEL = "claude-3-haiku-20240307"
+DEFAULT_MAX_TOKENS = 1000
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment"""
+    value = os.getenv(name)
+    return float(value) if value else default
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment"""
+    value = os.getenv(name)
+    return int(value) if value else default
+
 class UnifiedMCPClient:
-    def __init__(self, tcp_port: int = 8080):
+    def __init__(self, tcp_port: int = 8080, tool_catalog_ttl: float = None, max_model_calls: int = None,
+                 tool_call_timeout: float = None, serial_tools: List[str] = None, max_frame_size: int = None,
+                 max_agent_steps: int = None, max_agent_tokens: int = None, max_agent_seconds: float = None,
+                 prompt_caching: bool = None, tool_namespacing: str = None, cacheable_tools: Dict[str, float] = None):
         self.connections: Dict[str, Dict[str, Any]] = {}
-        self.exit_stack = AsyncExitStack()
+        self.server_specs: Dict[str, str] = {}
+        self.lazy_servers = set()
+        self.connect_locks: Dict[str, asyncio.Lock] = {}
+        self.connect_timeout = env_float("SERVER_CONNECT_TIMEOUT", 30.0)
+        self.tool_cache_path = os.getenv("TOOL_CACHE_PATH", ".mcp_tool_cache.json")
+        self.tool_cache = load_tool_cache(self.tool_cache_path)
+        # Tool lists are only remembered for --lazy runs, or when a cache path was asked for
+        self.save_tool_cache = "TOOL_CACHE_PATH" in os.environ
+        self.remote_pool_size = max(env_int("REMOTE_POOL_SIZE", 2), 1)
+        self.supervisor = ConnectionSupervisor(
+            self,
+            interval=env_float("HEALTH_CHECK_INTERVAL", 30.0),
+            ping_timeout=env_float("HEALTH_CHECK_TIMEOUT", 5.0),
+            max_backoff=env_float("RECONNECT_MAX_BACKOFF", 60.0)
+        )
+
+        if tool_catalog_ttl is None:
+            tool_catalog_ttl = env_float("TOOL_CATALOG_TTL", 300.0)
+        if tool_namespacing is None:
+            tool_namespacing = os.getenv("TOOL_NAMESPACING", "collisions")
+        self.tool_catalog = ToolCatalog(ttl=tool_catalog_ttl, namespacing=tool_namespacing)
         
-        self.anthropic = Anthropic()
+        self.anthropic = AsyncAnthropic()
+        self.router = ModelRouter.from_policy(
+            load_routing_policy(os.getenv("ROUTING_POLICY", "")),
+            model=os.getenv("ANTHROPIC_MODEL") or DEFAULT_MODEL,
+            max_tokens=env_int("MODEL_MAX_TOKENS", DEFAULT_MAX_TOKENS),
+            unmatched_tools=[READ_RESULT_TOOL]
+        )
+        if max_model_calls is None:
+            max_model_calls = env_int("MAX_CONCURRENT_MODEL_CALLS", 8)
+        self.model_semaphore = asyncio.Semaphore(max_model_calls)
+
+        if tool_call_timeout is None:
+            tool_call_timeout = env_float("TOOL_CALL_TIMEOUT", 60.0)
+        self.tool_call_timeout = tool_call_timeout
+        if serial_tools is None:
+            serial_tools = [name.strip() for name in os.getenv("SERIAL_TOOLS", "").split(",") if name.strip()]
+        self.serial_tools = set(serial_tools)
+        if cacheable_tools is None:
+            cacheable_tools = parse_cacheable_tools(
+                os.getenv("TOOL_RESULT_CACHE", ""), env_float("TOOL_RESULT_CACHE_TTL", 60.0)
+            )
+        self.tool_result_cache = ToolResultCache(cacheable_tools, max_entries=env_int("TOOL_RESULT_CACHE_SIZE", 256))
+
+        result_store = None
+        if os.getenv("TOOL_RESULT_SPILL", "1").lower() not in ("0", "false", "no"):
+            result_store = ToolResultStore(
+                directory=os.getenv("TOOL_RESULT_SPILL_DIR") or None,
+                max_bytes=env_int("TOOL_RESULT_SPILL_MAX_BYTES", 64 * 1024 * 1024)
+            )
+            self.tool_catalog.set_builtin_tools([tool_from_dict(READ_RESULT_TOOL_SPEC)])
+        self.result_normalizer = ToolResultNormalizer(
+            max_chars=env_int("TOOL_RESULT_MAX_CHARS", 20000),
+            limits=parse_result_limits(os.getenv("TOOL_RESULT_LIMITS", ""), os.getenv("TOOL_RESULT_TRUNCATION", "head_tail")),
+            mode=os.getenv("TOOL_RESULT_TRUNCATION", "head_tail"),
+            store=result_store,
+            max_image_bytes=env_int("TOOL_RESULT_MAX_IMAGE_BYTES", 5 * 1024 * 1024),
+            max_images=env_int("TOOL_RESULT_MAX_IMAGES", 4)
+        )
+
+        self.max_agent_steps = max_agent_steps if max_agent_steps is not None else env_int("AGENT_MAX_STEPS", 8)
+        self.max_agent_tokens = max_agent_tokens if max_agent_tokens is not None else env_int("AGENT_MAX_TOKENS", 50000)
+        self.max_agent_seconds = max_agent_seconds if max_agent_seconds is not None else env_float("AGENT_MAX_SECONDS", 120.0)
+
+        if prompt_caching is None:
+            prompt_caching = os.getenv("PROMPT_CACHING", "1").lower() not in ("0", "false", "no")
+        self.prompt_caching = prompt_caching
+        self.prompt_cache_stats: Dict[str, Dict[str, int]] = {}
         self.tcp_port = tcp_port
         self.tcp_server = None
+        if max_frame_size is None:
+            max_frame_size = env_int("MAX_FRAME_SIZE", 1024 * 1024)
+        self.max_frame_size = max_frame_size
         self.running = True
         
-        self.conversation_history: Dict[str, List[Dict[str, Any]]] = {}
-        self.max_history_length = 10
+        self.conversations = ConversationStore(
+            max_tokens_per_conversation=env_int("HISTORY_MAX_TOKENS", 8000),
+            max_conversations=env_int("HISTORY_MAX_CONVERSATIONS", 1000),
+            max_total_tokens=env_int("HISTORY_MAX_TOTAL_TOKENS", 2_000_000),
+            ttl=env_float("HISTORY_TTL", 3600.0),
+            db_path=os.getenv("HISTORY_DB") or None,
+            on_evict=self._forget_conversation
+        )
+        self.conversation_locks = ConversationLocks(
+            max_waiters=env_int("MAX_CONVERSATION_WAITERS", 8),
+            timeout=env_float("QUERY_QUEUE_TIMEOUT", 30.0)
+        )
+
+        self.admission = AdmissionController(
+            max_concurrent=env_int("MAX_CONCURRENT_QUERIES", 32),
+            max_queue=env_int("MAX_QUEUED_QUERIES", 64),
+            queue_timeout=env_float("QUERY_QUEUE_TIMEOUT", 30.0)
+        )
+        self.max_tcp_connections = env_int("MAX_TCP_CONNECTIONS", 256)
+        self.drain_timeout = env_float("SHUTDOWN_DRAIN_TIMEOUT", 30.0)
+        self.draining = False
+        self.shutdown_requested = asyncio.Event()
+        self.active_requests = set()
+        self.batch_requests = set()
+        self.tcp_writers = set()
+        self.servers_file = None
+        self.base_servers: Dict[str, str] = {}
+        self.reload_lock = asyncio.Lock()
+        self.reload_task = None
+        self.retiring = set()
+        self.batch_concurrency = max(env_int("BATCH_CONCURRENCY", 4), 1)
+        self.max_batch_items = env_int("BATCH_MAX_ITEMS", 10000)
+        self.batch_dir = os.getenv("BATCH_DIR") or None
+        self.batch_poll_interval = env_float("BATCH_POLL_INTERVAL", 30.0)
+        self.batch_ids = itertools.count(1)
+        self.max_pipelined_requests = max(env_int("MAX_PIPELINED_REQUESTS", 8), 1)
+        self.client_rate_limit = env_float("CLIENT_RATE_LIMIT", 2.0)
+        self.client_rate_burst = env_float("CLIENT_RATE_BURST", 10.0)
+        self.tcp_clients = 0
+
+        self.metrics_port = os.getenv("METRICS_PORT", "9464")
+        self.metrics_server = None
+        self.metrics = MetricsRegistry()
+        self.request_seconds = self.metrics.histogram(
+            "gateway_request_seconds", "End-to-end TCP request latency", ["type", "status"])
+        self.stage_seconds = self.metrics.histogram(
+            "gateway_stage_seconds", "Time spent in gateway stages (conversation_lock, admission_queue, history, tool_listing, tcp_write)", ["stage"])
+        self.model_queue_seconds = self.metrics.histogram(
+            "anthropic_queue_seconds", "Time spent waiting for a model call slot")
+        self.model_seconds = self.metrics.histogram(
+            "anthropic_request_seconds", "Anthropic Messages API call latency", ["model", "status"])
+        self.model_tokens = self.metrics.counter(
+            "anthropic_tokens_total", "Tokens reported by the Anthropic API", ["model", "kind"])
+        self.tool_seconds = self.metrics.histogram(
+            "mcp_tool_call_seconds", "MCP call_tool round-trip latency", ["server", "tool", "status"])
+        self.tcp_connections_gauge = self.metrics.gauge("gateway_tcp_connections", "Open TCP client connections")
+        self.requests_in_flight_gauge = self.metrics.gauge("gateway_requests_in_flight", "TCP requests being processed")
+        self.metrics.gauge(
+            "mcp_server_up", "1 when the last health check of a server succeeded", ["server"],
+            collect=lambda: [({"server": name}, int(state["status"] in ("healthy", "lazy")))
+                             for name, state in self.supervisor.health.items()]
+        )
+        self.metrics.counter(
+            "tool_result_cache_events_total", "Tool result cache hits, misses, coalesced calls and evictions",
+            ["tool", "event"],
+            collect=lambda: [({"tool": tool, "event": event}, count)
+                             for tool, counters in self.tool_result_cache.stats.items()
+                             for event, count in counters.items()]
+        )
+        self.routed_queries = self.metrics.counter(
+            "gateway_routed_queries_total", "Queries by routing policy entry and chosen model", ["route", "model"])
+        self.truncated_results = self.metrics.counter(
+            "mcp_tool_results_truncated_total", "Tool results cut to their size cap before reaching the model", ["server", "tool"])
+        self.rejected_requests = self.metrics.counter(
+            "gateway_rejected_total", "Requests and connections turned away by admission control", ["reason"])
+        self.metrics.gauge(
+            "gateway_admission", "Queries running and waiting for an admission slot", ["state"],
+            collect=lambda: [({"state": "running"}, self.admission.running), ({"state": "queued"}, self.admission.waiting)]
+        )
+        self.log_suppressed = self.metrics.counter(
+            "log_messages_suppressed_total", "Log records dropped by rate limiting", ["logger"])
+
+    async def connect_servers(self, servers: Dict[str, str], lazy: bool = False) -> Dict[str, BaseException]:
+        """Connect to several servers concurrently; failures are reported and skipped"""
+        self.server_specs.update(servers)
+        self.save_tool_cache = self.save_tool_cache or lazy
+        eager = {}
+        for server_name, server_arg in servers.items():
+            cached_tools = self.tool_cache.get(server_arg) if lazy else None
+            if cached_tools is None:
+                eager[server_name] = server_arg
+                self.tool_catalog.set_server_tools(server_name, [])
+                continue
+            log.info("Deferring connection to %s until one of its tools is needed: %s", server_name, server_arg)
+            self.lazy_servers.add(server_name)
+            self.tool_catalog.set_server_tools(server_name, cached_tools)
+
+        results = await asyncio.gather(
+            *(self.connect_server(name, arg) for name, arg in eager.items()),
+            return_exceptions=True
+        )
+
+        failed = {}
+        for (server_name, server_arg), result in zip(eager.items(), results):
+            if isinstance(result, BaseException):
+                reason = "timed out" if isinstance(result, asyncio.TimeoutError) else repr(result)
+                log.warning("Skipping server %s (%s): %s", server_name, server_arg, reason)
+                self.tool_catalog.remove_server(server_name)
+                failed[server_name] = result
+        return failed
+
+    async def connect_server(self, server_name: str, server_arg: str, register: bool = True) -> Dict[str, Any]:
+        """Connect to a local or remote server, bounded by the connect timeout
 
-    async def connect_to_local_server(self, server_name: str, server_script_path: str):
+        With register=False the connection is returned without being published, for reload_servers to swap in.
+        """
+        if register:
+            self.server_specs[server_name] = server_arg
+        if detect_connection_type(server_arg) == 'local':
+            log.info("Connecting to LOCAL server %s: %s", server_name, server_arg)
+            connect = self.connect_to_local_server(server_name, server_arg, register)
+        else:
+            log.info("Connecting to REMOTE server %s: %s", server_name, server_arg)
+            connect = self.connect_to_remote_server(server_name, server_arg, register)
+        return await asyncio.wait_for(connect, timeout=self.connect_timeout)
+
+    async def ensure_connected(self, server_name: str):
+        """Connect a lazily deferred server the first time it is needed"""
+        if server_name in self.connections:
+            return
+        if server_name not in self.server_specs:
+            raise RuntimeError(f"No server {server_name} connected")
+
+        lock = self.connect_locks.setdefault(server_name, asyncio.Lock())
+        async with lock:
+            if server_name not in self.connections:
+                await self.connect_server(server_name, self.server_specs[server_name])
+                self.lazy_servers.discard(server_name)
+
+    async def connect_to_local_server(self, server_name: str, server_script_path: str, register: bool = True) -> Dict[str, Any]:
         """Connect to a local MCP server"""
         parts = server_script_path.split()
         if parts[0].endswith(".py"):
@@ -38,394 +280,963 @@ class UnifiedMCPClient:
             args = parts[1:]
 
         server_params = StdioServerParameters(command=command, args=args, env=None)
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        stdio, write = stdio_transport
-        session = await self.exit_stack.enter_async_context(ClientSession(stdio, write))
-        await session.initialize()
-
-        response = await session.list_tools()
-        tools = response.tools
-        print(f"Connected to LOCAL server {server_name} with tools: {[tool.name for tool in tools]}")
-
-        self.connections[server_name] = {
-            "type": "local",
-            "session": session,
-            "stdio": stdio,
-            "write": write
-        }
 
-    async def connect_to_remote_server(self, server_name: str, server_url: str):
-        """Connect to a remote MCP server and keep the client alive"""
-        client = FastMCPClient(server_url)
-        await client.__aenter__()
-        tools = await client.list_tools()
-        print(f"Connected to REMOTE server {server_name} with tools: {[tool.name for tool in tools]}")
-        self.connections[server_name] = {
-            "type": "remote",
-            "client": client,
-            "tools": tools
-        }
+        async def open_connection(stack: AsyncExitStack) -> Dict[str, Any]:
+            stdio, write = await stack.enter_async_context(stdio_client(server_params))
+            session = await stack.enter_async_context(
+                ClientSession(stdio, write, message_handler=self._make_message_handler(server_name))
+            )
+            await session.initialize()
+
+            response = await session.list_tools()
+            return {
+                "type": "local",
+                "session": session,
+                "stdio": stdio,
+                "write": write,
+                "tools": response.tools
+            }
+
+        conn = await self._start_connection(server_name, server_script_path, open_connection, register)
+        log.info("Connected to LOCAL server %s with tools: %s", server_name, [tool.name for tool in conn["tools"]])
+        return conn
+
+    async def connect_to_remote_server(self, server_name: str, server_url: str, register: bool = True) -> Dict[str, Any]:
+        """Connect to a remote MCP server and keep a pool of client sessions alive"""
+        async def open_connection(stack: AsyncExitStack) -> Dict[str, Any]:
+            clients = []
+            for _ in range(self.remote_pool_size):
+                client = FastMCPClient(server_url, message_handler=self._make_message_handler(server_name))
+                await stack.enter_async_context(client)
+                clients.append(client)
+            return {
+                "type": "remote",
+                "client": clients[0],
+                "clients": clients,
+                "in_flight": [0] * len(clients),
+                "tools": await clients[0].list_tools()
+            }
+
+        conn = await self._start_connection(server_name, server_url, open_connection, register)
+        log.info("Connected to REMOTE server %s with tools: %s", server_name, [tool.name for tool in conn["tools"]])
+        return conn
+
+    async def _start_connection(self, server_name: str, server_arg: str,
+                                open_connection: Callable[[AsyncExitStack], Awaitable[Dict[str, Any]]],
+                                register: bool = True) -> Dict[str, Any]:
+        """Open a connection in its own task and register it once it is ready"""
+        ready = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+        task = asyncio.create_task(self._run_connection(server_name, open_connection, ready, stop))
+        try:
+            conn = await asyncio.shield(ready)
+        except BaseException:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
 
-    async def get_tools(self, server_name: str = None):
-        if server_name:
-            conn = self.connections.get(server_name)
-            if not conn:
-                raise RuntimeError(f"No server {server_name} connected")
+        conn["stop"] = stop
+        conn["task"] = task
+        conn["calls"] = 0
+        if register:
+            self._register_connection(server_name, server_arg, conn)
+            self.tool_catalog.set_server_tools(server_name, conn["tools"])
+        return conn
 
-            if conn["type"] == "local":
-                response = await conn["session"].list_tools()
-                return response.tools
+    def _register_connection(self, server_name: str, server_arg: str, conn: Dict[str, Any]):
+        self.server_specs[server_name] = server_arg
+        self.connections[server_name] = conn
+        if self.save_tool_cache:
+            self.tool_cache[server_arg] = list(conn["tools"])
+            save_tool_cache(self.tool_cache_path, self.tool_cache)
+
+    async def _run_connection(self, server_name: str, open_connection: Callable[[AsyncExitStack], Awaitable[Dict[str, Any]]],
+                              ready: asyncio.Future, stop: asyncio.Event):
+        """Own a server's transport contexts so they are entered and exited in the same task"""
+        try:
+            async with AsyncExitStack() as stack:
+                conn = await open_connection(stack)
+                ready.set_result(conn)
+                await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
             else:
-                client = conn["client"]
-                return await client.list_tools()
-        else:
-            all_tools = []
-            for srv_name, conn in self.connections.items():
-                try:
-                    if conn["type"] == "local":
-                        response = await conn["session"].list_tools()
-                        tools = response.tools
-                    else:
-                        client = conn["client"]
-                        tools = await client.list_tools()
-        
-                    for tool in tools:
-                        tool._server_name = srv_name
-                    all_tools.extend(tools)
-                except Exception as e:
-                    print(f"Error getting tools from {srv_name}: {e}")
-            return all_tools
+                log.warning("Connection to %s closed with error: %s", server_name, e)
 
-    async def call_tool(self, server_name: str, tool_name: str, tool_input: dict):
+    async def disconnect_server(self, server_name: str):
+        """Close one server connection"""
+        conn = self.connections.pop(server_name, None)
+        if not conn:
+            return
+        conn["stop"].set()
+        await asyncio.gather(conn["task"], return_exceptions=True)
+        self.tool_result_cache.invalidate(server_name)
+
+    async def reload_servers(self, servers: Dict[str, str]) -> Dict[str, BaseException]:
+        """Bring the connected servers in line with servers, updating the tool catalog in one step
+
+        New and changed servers are connected before anything is swapped, and a changed server whose new
+        spec fails keeps its old connection. Replaced connections close once their running tool calls end.
+        """
+        async with self.reload_lock:
+            removed = [name for name in self.server_specs if name not in servers]
+            wanted = {name: spec for name, spec in servers.items() if self.server_specs.get(name) != spec}
+            results = await asyncio.gather(
+                *(self.connect_server(name, spec, register=False) for name, spec in wanted.items()),
+                return_exceptions=True
+            )
+
+            failed = {}
+            connected = {}
+            for (name, spec), result in zip(wanted.items(), results):
+                if isinstance(result, BaseException):
+                    log.warning("Reload: could not connect %s (%s): %r", name, spec, result)
+                    failed[name] = result
+                else:
+                    connected[name] = (spec, result)
+
+            retired = [(name, self.connections.pop(name)) for name in removed + list(connected) if name in self.connections]
+            for name in removed:
+                self.server_specs.pop(name, None)
+                self.lazy_servers.discard(name)
+            for name, (spec, conn) in connected.items():
+                self._register_connection(name, spec, conn)
+                self.lazy_servers.discard(name)
+            for name in removed + list(connected):
+                self.supervisor.health.pop(name, None)
+                self.tool_result_cache.invalidate(name)
+            self.tool_catalog.replace_servers({name: conn["tools"] for name, (_, conn) in connected.items()}, removed)
+            log.info("Reloaded servers: connected %s, removed %s, failed %s", list(connected), removed, list(failed))
+
+        await asyncio.gather(*(self.retire_connection(name, conn) for name, conn in retired))
+        return failed
+
+    async def reload_from_file(self) -> Optional[Dict[str, BaseException]]:
+        """Reload the server list from the servers file, on SIGHUP or the reload command"""
+        if not self.servers_file:
+            log.warning("No servers file to reload; start the gateway with --servers-file")
+            return None
+        try:
+            servers = load_servers_file(self.servers_file)
+        except (OSError, ValueError) as e:
+            log.warning("Not reloading, cannot read %s: %s", self.servers_file, e)
+            return None
+        return await self.reload_servers(self.with_base_servers(servers))
+
+    def with_base_servers(self, servers: Dict[str, str]) -> Dict[str, str]:
+        """Servers from the file plus the command-line ones, which a file entry never replaces"""
+        clashing = [name for name in servers if name in self.base_servers]
+        if clashing:
+            log.warning("Ignoring servers file entries %s: the names belong to command-line servers", clashing)
+        return dict(servers, **self.base_servers)
+
+    async def retire_connection(self, server_name: str, conn: Dict[str, Any]):
+        """Close a replaced connection once the tool calls already using it have finished"""
+        deadline = time.monotonic() + self.tool_call_timeout
+        while conn["calls"] and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        conn["stop"].set()
+        await asyncio.gather(conn["task"], return_exceptions=True)
+        log.info("Closed previous connection to %s", server_name)
+
+    def _make_message_handler(self, server_name: str):
+        """Build an MCP message handler that invalidates the catalog on tools/list_changed"""
+        async def handle_message(message):
+            notification = getattr(message, "root", message)
+            if isinstance(notification, mcp_types.ToolListChangedNotification):
+                log.info("Tool list changed on server %s", server_name)
+                self.tool_catalog.invalidate(server_name)
+        return handle_message
+
+    async def _list_server_tools(self, server_name: str):
+        """Fetch the current tool list of a single server"""
+        if server_name in self.lazy_servers and server_name not in self.connections:
+            return self.tool_catalog.server_tools.get(server_name, [])
+        return await self.get_tools(server_name)
+
+    async def refresh_tools(self):
+        """Force a full re-fetch of the tool catalog"""
+        await self.tool_catalog.refresh(self._list_server_tools, list(self.tool_catalog.server_tools.keys()))
+        return self.tool_catalog.tools
+
+    async def get_tools(self, server_name: str):
+        """List the tools of one connected server; the catalog calls this only when a server's list is stale"""
         conn = self.connections.get(server_name)
         if not conn:
             raise RuntimeError(f"No server {server_name} connected")
 
         if conn["type"] == "local":
-            return await conn["session"].call_tool(tool_name, tool_input)
+            response = await conn["session"].list_tools()
+            return response.tools
         else:
             client = conn["client"]
-            return await client.call_tool(tool_name, tool_input)
+            return await client.list_tools()
+
+    async def call_tool(self, server_name: str, tool_name: str, tool_input: dict):
+        """Call a tool, serving repeated calls of cacheable tools from the result cache"""
+        return await self.tool_result_cache.call(
+            server_name, tool_name, tool_input,
+            lambda: self._call_server_tool(server_name, tool_name, tool_input)
+        )
+
+    async def _call_server_tool(self, server_name: str, tool_name: str, tool_input: dict):
+        if server_name in self.lazy_servers:
+            await self.ensure_connected(server_name)
+        conn = self.connections.get(server_name)
+        if not conn:
+            raise RuntimeError(f"No server {server_name} connected")
+
+        conn["calls"] += 1
+        with timed(self.tool_seconds, "tool", server=server_name, tool=tool_name) as labels:
+            try:
+                if conn["type"] == "local":
+                    result = await conn["session"].call_tool(tool_name, tool_input)
+                else:
+                    in_flight = conn["in_flight"]
+                    index = in_flight.index(min(in_flight))
+                    in_flight[index] += 1
+                    try:
+                        result = await conn["clients"][index].call_tool(tool_name, tool_input)
+                    finally:
+                        in_flight[index] -= 1
+            except Exception:
+                self.supervisor.report_failure(server_name)
+                raise
+            finally:
+                conn["calls"] -= 1
+            if getattr(result, "isError", False):
+                labels["status"] = "error"
+            return result
+
+    async def reconnect_server(self, server_name: str):
+        """Replace a server connection with a fresh one, keeping the old one in service until the new one is up"""
+        async with self.reload_lock:
+            server_arg = self.server_specs[server_name]
+            conn = await self.connect_server(server_name, server_arg, register=False)
+            old = self.connections.pop(server_name, None)
+            self._register_connection(server_name, server_arg, conn)
+            self.tool_catalog.set_server_tools(server_name, conn["tools"])
+            self.tool_result_cache.invalidate(server_name)
+            self.lazy_servers.discard(server_name)
+        if old:
+            # Calls still running on a live but slow server finish there; the supervisor does not wait for them
+            task = asyncio.create_task(self.retire_connection(server_name, old))
+            self.retiring.add(task)
+            task.add_done_callback(self.retiring.discard)
 
     def find_tool_server(self, tool_name: str) -> Optional[str]:
         """Find which server has the specified tool"""
-        for server_name in self.connections.keys():
-            try:
-                asyncio.create_task(self._check_tool_exists(server_name, tool_name))
-            except:
+        target = self.tool_catalog.route(tool_name)
+        return target[0] if target else None
+
+    async def create_message(self, on_event: Callable[[Dict[str, Any]], Awaitable[None]] = None, **kwargs):
+        """Call the Anthropic Messages API without blocking the event loop, streaming text deltas to on_event"""
+        model = kwargs.get("model", "")
+        with timed(self.model_queue_seconds, "model_queue"):
+            await self.model_semaphore.acquire()
+        try:
+            with timed(self.model_seconds, "model", model=model):
+                if on_event is None:
+                    response = await self.anthropic.messages.create(**kwargs)
+                else:
+                    async with self.anthropic.messages.stream(**kwargs) as stream:
+                        async for event in stream:
+                            if event.type == "text":
+                                await on_event({"event": "text_delta", "text": event.text})
+                        response = await stream.get_final_message()
+        finally:
+            self.model_semaphore.release()
+
+        usage = getattr(response, "usage", None)
+        if usage:
+            for kind in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+                self.model_tokens.inc(getattr(usage, kind, None) or 0, model=model, kind=kind)
+        return response
+
+    def is_serial_tool(self, tool_name: str) -> bool:
+        """Check whether a tool must not run alongside other tool calls"""
+        target = self.tool_catalog.route(tool_name)
+        if tool_name in self.serial_tools or (target and target[1] in self.serial_tools):
+            return True
+        tool = self.tool_catalog.tool_map.get(tool_name)
+        annotations = getattr(tool, "annotations", None)
+        return annotations is not None and getattr(annotations, "idempotentHint", None) is False
+
+    async def execute_tool_calls(self, tool_calls: List[Any], tool_routes: Dict[str, Tuple[str, str]], preferred_server: str = None,
+                                 on_event: Callable[[Dict[str, Any]], Awaitable[None]] = None) -> List[Dict[str, Any]]:
+        """Run the tool calls of one Claude turn, keeping results in call order
+
+        Consecutive calls to ordinary tools run concurrently. A serial tool waits for every call before
+        it and finishes before any call after it starts, so a write never overtakes an earlier read.
+        """
+        results: List[Dict[str, Any]] = []
+        group: List[Any] = []
+        for call in tool_calls + [None]:
+            if call is not None and not self.is_serial_tool(call.name):
+                group.append(call)
                 continue
-        return None
+            results.extend(await asyncio.gather(*(
+                self._execute_tool_call(pending, tool_routes, preferred_server, on_event) for pending in group
+            )))
+            group = []
+            if call is not None:
+                results.append(await self._execute_tool_call(call, tool_routes, preferred_server, on_event))
+        return results
 
-    async def _check_tool_exists(self, server_name: str, tool_name: str) -> bool:
-        """Check if a tool exists on a server"""
+    async def _execute_tool_call(self, tool_call: Any, tool_routes: Dict[str, Tuple[str, str]], preferred_server: str = None,
+                                 on_event: Callable[[Dict[str, Any]], Awaitable[None]] = None) -> Dict[str, Any]:
+        """Execute a single tool_use block and convert it into a tool_result block"""
+        result = await self._run_tool_call(tool_call, tool_routes, preferred_server, on_event)
+        if on_event:
+            status = "failed" if result.get("is_error") else "finished"
+            await on_event({"event": "tool_call", "tool_use_id": tool_call.id, "name": tool_call.name, "status": status})
+        return result
+
+    async def _run_tool_call(self, tool_call: Any, tool_routes: Dict[str, Tuple[str, str]], preferred_server: str = None,
+                             on_event: Callable[[Dict[str, Any]], Awaitable[None]] = None) -> Dict[str, Any]:
         try:
-            tools = await self.get_tools(server_name)
-            return any(tool.name == tool_name for tool in tools)
-        except:
-            return False
+            target_server, tool_name = tool_routes.get(tool_call.name) or (
+                preferred_server or next(iter(self.connections or self.lazy_servers)), tool_call.name
+            )
+
+            log.debug("Calling tool %s on server %s", tool_name, target_server)
+            if on_event:
+                await on_event({
+                    "event": "tool_call",
+                    "tool_use_id": tool_call.id,
+                    "name": tool_call.name,
+                    "server": target_server,
+                    "status": "started"
+                })
+            if target_server == BUILTIN_SERVER and tool_name == READ_RESULT_TOOL:
+                content, is_error = self.result_normalizer.read(tool_call.input or {})
+            else:
+                tool_result = await asyncio.wait_for(
+                    self.call_tool(target_server, tool_name, tool_call.input),
+                    timeout=self.tool_call_timeout
+                )
+                content, is_error, truncated = self.result_normalizer.normalize(target_server, tool_name, tool_result)
+                if truncated:
+                    self.truncated_results.inc(server=target_server, tool=tool_name)
+
+            log.debug("Tool %s result: %.200s", tool_name, content)
+            result = {
+                "type": "tool_result",
+                "tool_use_id": tool_call.id,
+                "content": content
+            }
+            if is_error:
+                result["is_error"] = True
+            return result
+
+        except asyncio.TimeoutError:
+            log.warning("Tool %s timed out after %ss", tool_call.name, self.tool_call_timeout)
+            return {
+                "type": "tool_result",
+                "tool_use_id": tool_call.id,
+                "content": f"Error: tool {tool_call.name} timed out after {self.tool_call_timeout}s",
+                "is_error": True
+            }
+        except Exception as e:
+            log.warning("Tool %s failed: %s", tool_call.name, e)
+            return {
+                "type": "tool_result",
+                "tool_use_id": tool_call.id,
+                "content": f"Error: {str(e)}",
+                "is_error": True
+            }
 
     async def start_tcp_server(self):
         """Start the TCP server for external connections"""
         self.tcp_server = await asyncio.start_server(
             self.handle_tcp_client, 
             'localhost', 
-            self.tcp_port
+            self.tcp_port,
+            limit=self.max_frame_size
         )
-        print(f"TCP server started on port {self.tcp_port}")
+        log.info("TCP server started on port %s", self.tcp_port)
+
+    async def start_metrics_server(self):
+        """Serve Prometheus metrics on localhost unless METRICS_PORT is off"""
+        if self.metrics_port.lower() in ("", "off", "none"):
+            return
+        self.metrics_server = await start_metrics_server(self.metrics, "localhost", int(self.metrics_port))
+        log.info("Metrics available at http://localhost:%s/metrics", self.metrics_server.sockets[0].getsockname()[1])
 
     def get_conversation_id(self, client_addr: str = "console") -> str:
         """Generate a conversation ID based on client address"""
         return str(client_addr)
 
+    def _forget_conversation(self, conversation_id: str):
+        """Drop per-conversation state when the store evicts a conversation"""
+        self.prompt_cache_stats.pop(conversation_id, None)
+
     def get_conversation_history(self, conversation_id: str) -> List[Dict[str, Any]]:
         """Get conversation history for a specific conversation"""
-        return self.conversation_history.get(conversation_id, [])
+        return self.conversations.get(conversation_id)
 
     def add_to_conversation_history(self, conversation_id: str, role: str, content: Any):
         """Add a message to conversation history"""
-        if conversation_id not in self.conversation_history:
-            self.conversation_history[conversation_id] = []
-        
-        self.conversation_history[conversation_id].append({
-            "role": role,
-            "content": content
-        })
-        
-        if len(self.conversation_history[conversation_id]) > self.max_history_length * 2:
-            history = self.conversation_history[conversation_id]
-            if history[0].get("role") == "system":
-                self.conversation_history[conversation_id] = [history[0]] + history[-(self.max_history_length * 2 - 1):]
-            else:
-                self.conversation_history[conversation_id] = history[-self.max_history_length * 2:]
+        self.conversations.append(conversation_id, role, content)
 
     async def handle_tcp_client(self, reader, writer):
-        """Handle incoming TCP connections"""
+        """Handle incoming TCP connections speaking newline-delimited JSON frames"""
         client_addr = writer.get_extra_info('peername')
         conversation_id = self.get_conversation_id(str(client_addr))
-        print(f"\nTCP client connected: {client_addr}")
+        in_flight = set()
+        if self.tcp_clients >= self.max_tcp_connections:
+            log.warning("Rejecting TCP client %s: %s connections open", client_addr, self.tcp_clients)
+            self.rejected_requests.inc(reason="connections")
+            await self.send_tcp_frame(writer, {
+                "status": "error",
+                "error": "Server busy, too many connections",
+                "code": "busy",
+                "retry_after": 1.0,
+                "timestamp": asyncio.get_event_loop().time()
+            })
+            writer.close()
+            return
+
+        bucket = TokenBucket(self.client_rate_limit, self.client_rate_burst)
+        self.tcp_writers.add(writer)
+        self.tcp_clients += 1
+        log.info("TCP client connected: %s", client_addr)
+        self.tcp_connections_gauge.inc()
 
         try:
             while self.running:
-                data = await reader.read(4096)
-                if not data:
-                    break
-                message = data.decode("utf-8").strip()
-                if not message:
+                if len(in_flight) >= self.max_pipelined_requests:
+                    # Stop reading until a request finishes so the client's socket buffer fills up
+                    await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
                     continue
 
-                print(f"Received TCP message: {message}")
-                
                 try:
-                    print(f"Processing message: {message}")
-                    response = await self.process_tcp_message(message, conversation_id)
-                    response_data = {
-                        "status": "success",
-                        "data": response,
-                        "timestamp": asyncio.get_event_loop().time()
-                    }
-                    print(f"Response generated: {response}")
-                except Exception as e:
-                    print(f"Error processing message: {str(e)}")
-                    response_data = {
+                    data = await reader.readline()
+                except ValueError:
+                    log.warning("Frame from %s exceeds %s bytes, closing connection", client_addr, self.max_frame_size)
+                    await self.send_tcp_response(writer, {
                         "status": "error",
-                        "error": str(e),
+                        "error": f"Frame exceeds maximum size of {self.max_frame_size} bytes",
                         "timestamp": asyncio.get_event_loop().time()
-                    }
-
-                response_json = json.dumps(response_data, ensure_ascii=False) + "\n"
-                print(f"Sending response: {response_json.strip()}")
-                
-                try:
-                    writer.write(response_json.encode("utf-8"))
-                    await writer.drain()
-                    print("Response sent successfully!")
-                except Exception as send_error:
-                    print(f"Failed to send response: {send_error}")
+                    })
                     break
+                if not data:
+                    break
+                message = data.decode("utf-8", errors="replace").strip()
+                if not message:
+                    continue
+
+                log.debug("Received TCP message: %.200s", message)
+                task = asyncio.create_task(self.handle_tcp_request(message, conversation_id, writer, bucket))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+            if in_flight:
+                # Queries may still finish for a half-closed client, but a batch only reports to this
+                # connection, so it is stopped (cancelling any Message Batches job) once the client is gone
+                for task in in_flight & self.batch_requests:
+                    task.cancel()
+                await asyncio.gather(*in_flight, return_exceptions=True)
 
         except ConnectionResetError:
-            print(f"TCP client disconnected unexpectedly: {client_addr}")
+            log.info("TCP client disconnected unexpectedly: %s", client_addr)
         except Exception as e:
-            print(f"Error in TCP handler: {str(e)}")
+            log.error("Error in TCP handler: %s", e)
         finally:
+            for task in in_flight:
+                task.cancel()
             writer.close()
-            await writer.wait_closed()
-            print(f"TCP client disconnected: {client_addr}")
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.tcp_writers.discard(writer)
+            self.tcp_clients -= 1
+            self.tcp_connections_gauge.dec()
+            log.info("TCP client disconnected: %s", client_addr)
 
-    async def process_tcp_message(self, message: str, conversation_id: str) -> str:
-        """Process incoming TCP messages"""
-        parsed = None
+    async def handle_tcp_request(self, message: str, conversation_id: str, writer, bucket: TokenBucket = None):
+        """Process one frame and write its response, tagged with the request id if any"""
+        trace = start_trace()
+        request = self.parse_tcp_frame(message)
+        request_type = request.get("type") if request.get("type") in ("resume", "batch") else "query"
+        # Batch items are always reported as they finish
+        stream = bool(request.get("stream")) or request_type == "batch"
+
+        async def send_event(event: Dict[str, Any]) -> bool:
+            event["conversation_id"] = conversation_id
+            if "id" in request:
+                event["id"] = request["id"]
+            return await self.send_tcp_frame(writer, event)
+
+        status = "success"
+        task = asyncio.current_task()
+        self.active_requests.add(task)
+        if request_type == "batch":
+            self.batch_requests.add(task)
+        self.requests_in_flight_gauge.inc()
+        try:
+            try:
+                if self.draining:
+                    raise Rejected("shutting_down", "Server is shutting down", 1.0)
+                retry_after = bucket.try_acquire() if bucket else 0.0
+                if retry_after:
+                    raise Rejected("rate_limited", "Rate limit exceeded, slow down", round(retry_after, 2))
+                conversation_id = self.resolve_conversation_id(request, conversation_id)
+                response = await self.process_tcp_message(request, conversation_id, send_event if stream else None)
+                response_data = {
+                    "status": "success",
+                    "data": response,
+                    "timestamp": asyncio.get_event_loop().time(),
+                    "conversation_id": conversation_id,
+                    "cursor": self.conversations.cursor(conversation_id)
+                }
+            except Rejected as e:
+                log.info("Rejected request from %s: %s", conversation_id, e.code)
+                self.rejected_requests.inc(reason=e.code)
+                status = e.code
+                response_data = {
+                    "status": "error",
+                    "error": str(e),
+                    "code": e.code,
+                    "retry_after": e.retry_after,
+                    "timestamp": asyncio.get_event_loop().time()
+                }
+            except Exception as e:
+                log.warning("Error processing message: %s", e)
+                status = "error"
+                response_data = {
+                    "status": "error",
+                    "error": str(e),
+                    "timestamp": asyncio.get_event_loop().time()
+                }
+
+            if "id" in request:
+                response_data["id"] = request["id"]
+            if stream:
+                response_data["event"] = "done"
+                response_data["conversation_id"] = conversation_id
+            await self.send_tcp_response(writer, response_data)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            self.active_requests.discard(task)
+            self.batch_requests.discard(task)
+            self.requests_in_flight_gauge.dec()
+            self.request_seconds.observe(trace.elapsed(), type=request_type, status=status)
+            log.info("%s %s conversation=%s %s", request_type, status, conversation_id, trace.summary())
+
+    def resolve_conversation_id(self, request: Dict[str, Any], default: str) -> str:
+        """Use the client-supplied conversation id when present, otherwise the connection's id"""
+        conversation_id = request.get("conversation_id")
+        if conversation_id is None:
+            return default
+        if not isinstance(conversation_id, str) or not conversation_id or len(conversation_id) > 128:
+            raise ValueError("conversation_id must be a non-empty string of at most 128 characters")
+        return conversation_id
+
+    def resume_conversation(self, conversation_id: str, cursor: int = 0) -> Dict[str, Any]:
+        """Return the messages of a conversation at or after cursor so a reconnecting client can catch up"""
+        if not isinstance(cursor, int) or cursor < 0:
+            raise ValueError("cursor must be a non-negative integer")
+        messages, next_cursor, truncated = self.conversations.since(conversation_id, cursor)
+        return {
+            "conversation_id": conversation_id,
+            "known": conversation_id in self.conversations,
+            "cursor": next_cursor,
+            "truncated": truncated,
+            "messages": messages
+        }
+
+    async def send_tcp_response(self, writer, response_data: Dict[str, Any]):
+        """Write a final response frame to a TCP client"""
+        if await self.send_tcp_frame(writer, response_data):
+            log.debug("Sent response: %.200s", response_data.get("data", response_data.get("error")))
+
+    async def send_tcp_frame(self, writer, data: Dict[str, Any]) -> bool:
+        """Write one JSON frame to a TCP client"""
+        try:
+            with timed(self.stage_seconds, "tcp_write", stage="tcp_write"):
+                writer.write((json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain()
+            return True
+        except Exception as send_error:
+            log.warning("Failed to send response: %s", send_error)
+            return False
+
+    def parse_tcp_frame(self, message: str) -> Dict[str, Any]:
+        """Decode one frame; anything that is not a JSON object is treated as a bare query"""
         try:
             parsed = json.loads(message)
         except json.JSONDecodeError:
-            pass
+            parsed = None
 
-        server_name = None
-        if isinstance(parsed, dict):
-            query = parsed.get("query", message)
-            if "server" in parsed:
-                server_name = parsed["server"]
-        else:
-            query = message
+        if not isinstance(parsed, dict):
+            return {"query": message}
+        if "query" not in parsed:
+            parsed["query"] = message
+        return parsed
 
-        if not self.connections:
+    async def process_tcp_message(self, message: Union[str, Dict[str, Any]], conversation_id: str,
+                                  on_event: Callable[[Dict[str, Any]], Awaitable[None]] = None) -> Any:
+        """Process incoming TCP messages"""
+        request = message if isinstance(message, dict) else self.parse_tcp_frame(message)
+        if request.get("type") == "resume":
+            return self.resume_conversation(conversation_id, request.get("cursor", 0))
+
+        if not self.connections and not self.lazy_servers:
             return "No servers connected."
+        if request.get("type") == "batch":
+            return await self.process_batch(request, conversation_id, on_event)
 
-        return await self.process_query(query, conversation_id, server_name)
+        query = request["query"]
+        server_name = request.get("server")
 
-    async def process_query(self, query: str, conversation_id: str = "console", preferred_server: str = None) -> str:
-        """Process a query using available MCP servers"""
-        print(f"Processing query: {query}")
-        if self.connections:
-            print(f"Connected servers: {list(self.connections.keys())}")
-        
+        with timed(self.stage_seconds, "conversation_lock", stage="conversation_lock"):
+            await self.conversation_locks.acquire(conversation_id)
         try:
-            messages = self.get_conversation_history(conversation_id).copy()
-            
-            user_message = {"role": "user", "content": query}
-            messages.append(user_message)
-            self.add_to_conversation_history(conversation_id, "user", query)
+            with timed(self.stage_seconds, "admission_queue", stage="admission_queue"):
+                await self.admission.acquire()
+            try:
+                return await self.process_query(query, conversation_id, server_name, on_event)
+            finally:
+                self.admission.release()
+        finally:
+            self.conversation_locks.release(conversation_id)
 
-            tools_raw = await self.get_tools()
-            available_tools = []
-            tool_server_map = {}
-            
-            for tool in tools_raw:
-                tool_info = {
-                    "name": tool.name, 
-                    "description": tool.description, 
-                    "input_schema": tool.inputSchema
-                }
-                available_tools.append(tool_info)
-                if hasattr(tool, '_server_name'):
-                    tool_server_map[tool.name] = tool._server_name
-
-            tool_names = [f"{tool['name']} ({tool.get('_server_name', 'unknown')})" for tool in available_tools]
-            print(f"Available tools: {tool_names}")
-            print(f"Conversation history length: {len(messages)}")
-
-            print("Sending message with context to Claude...")
-            anthropic_response = self.anthropic.messages.create(
-                model="claude-3-haiku-20240307",
-                messages=messages,
-                max_tokens=1000,
-                tools=available_tools
-            )
+    async def process_batch(self, request: Dict[str, Any], conversation_id: str,
+                            on_event: Callable[[Dict[str, Any]], Awaitable[None]] = None) -> Dict[str, Any]:
+        """Run the independent queries of a batch request with bounded concurrency, reporting each as it finishes"""
+        mode = request.get("mode", "agent")
+        if mode not in BATCH_MODES:
+            raise ValueError(f"Unknown batch mode {mode!r}, expected one of {BATCH_MODES}")
+        items = await asyncio.to_thread(load_batch_items, request, self.batch_dir, self.max_batch_items)
+        concurrency = min(max(int(request.get("concurrency") or self.batch_concurrency), 1), self.batch_concurrency)
+        batch_id = f"{conversation_id}#batch-{next(self.batch_ids)}"
+        counts = {"succeeded": 0, "failed": 0}
+        client_gone = False
+        log.info("Batch %s: %s items, mode %s, concurrency %s", batch_id, len(items), mode, concurrency)
 
-            print(f"Claude response received with {len(anthropic_response.content)} content blocks")
-
-            assistant_content = []
-            tool_calls = []
-
-            for content in anthropic_response.content:
-                if content.type == "text":
-                    print(f"Text content: {content.text}")
-                    assistant_content.append({"type": "text", "text": content.text})
-                elif content.type == "tool_use":
-                    print(f"Tool use: {content.name} with input: {content.input}")
-                    assistant_content.append({
-                        "type": "tool_use", 
-                        "id": content.id, 
-                        "name": content.name, 
-                        "input": content.input
-                    })
-                    tool_calls.append(content)
+        async def report(item: Dict[str, Any], status: str, data: str, code: str = None):
+            nonlocal client_gone
+            counts["succeeded" if status == "success" else "failed"] += 1
+            if on_event and not client_gone:
+                event = {"event": "batch_item", "index": item["index"], "custom_id": item["custom_id"], "status": status}
+                event["data" if status == "success" else "error"] = data
+                if code:
+                    event["code"] = code
+                client_gone = await on_event(event) is False
 
-            self.add_to_conversation_history(conversation_id, "assistant", assistant_content)
-            messages.append({"role": "assistant", "content": assistant_content})
+        if mode == "message_batches":
+            params = {"model": self.router.model, "max_tokens": self.router.max_tokens}
+            await run_message_batch(self.anthropic, items, params, self.batch_poll_interval, report)
+        else:
+            pending = iter(items)
 
-            if tool_calls:
-                print(f"Executing {len(tool_calls)} tool calls...")
-                tool_results = []
-                
-                for tool_call in tool_calls:
+            async def worker():
+                for item in pending:
+                    if client_gone:
+                        log.info("Batch %s: client is gone, not starting the remaining items", batch_id)
+                        return
                     try:
-                        target_server = None
-                        for tool_info in available_tools:
-                            if tool_info['name'] == tool_call.name:
-                                target_server = tool_info.get('_server_name')
-                                break
-                        
-                        if not target_server:
-                            target_server = preferred_server or list(self.connections.keys())[0]
-                        
-                        print(f"Calling tool {tool_call.name} on server {target_server}")
-                        tool_result = await self.call_tool(target_server, tool_call.name, tool_call.input)
-                        
-                        conn_type = self.connections[target_server]["type"]
-                        if conn_type == 'local':
-                            if hasattr(tool_result, 'content'):
-                                if isinstance(tool_result.content, list):
-                                    content_text = "".join([
-                                        getattr(item, 'text', str(item)) for item in tool_result.content
-                                    ])
-                                else:
-                                    content_text = str(tool_result.content)
-                            else:
-                                content_text = str(tool_result)
-                        else:
-                            if isinstance(tool_result, list) and len(tool_result) > 0:
-                                if hasattr(tool_result[0], 'text'):
-                                    content_text = tool_result[0].text
-                                else:
-                                    content_text = str(tool_result[0])
-                            else:
-                                content_text = str(tool_result)
-                        
-                        print(f"Tool result: {content_text}")
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": tool_call.id,
-                            "content": content_text
-                        })
-                        
+                        response = await self.process_batch_item(item, f"{batch_id}/{item['index']}")
+                    except Rejected as e:
+                        # Only a drain rejects a batch item; the items not started yet are answered the same way
+                        await report(item, "error", str(e), e.code)
+                        continue
                     except Exception as e:
-                        print(f"Tool execution failed: {str(e)}")
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": tool_call.id,
-                            "content": f"Error: {str(e)}"
-                        })
+                        await report(item, "error", str(e))
+                        continue
+                    if response.startswith("Error processing query:"):
+                        await report(item, "error", response)
+                    else:
+                        await report(item, "success", response)
 
-                self.add_to_conversation_history(conversation_id, "user", tool_results)
-                messages.append({"role": "user", "content": tool_results})
-                
-                print("Sending tool results to Claude for final response...")
-                followup_response = self.anthropic.messages.create(
-                    model="claude-3-haiku-20240307",
-                    messages=messages,
-                    max_tokens=1000,
-                    tools=available_tools
-                )
+            await asyncio.gather(*(worker() for _ in range(min(concurrency, len(items)))))
 
-                final_texts = []
-                final_assistant_content = []
-                
-                for content in followup_response.content:
-                    if content.type == "text":
-                        final_texts.append(content.text)
-                        final_assistant_content.append({"type": "text", "text": content.text})
-                        print(f"Final response: {content.text}")
+        return {"mode": mode, "total": len(items), **counts}
+
+    async def process_batch_item(self, item: Dict[str, Any], conversation_id: str) -> str:
+        """Run one batch query in a throwaway conversation, waiting for admission instead of failing when busy"""
+        with timed(self.stage_seconds, "admission_queue", stage="admission_queue"):
+            while True:
+                if self.draining:
+                    raise Rejected("shutting_down", "Server is shutting down", 1.0)
+                try:
+                    await self.admission.acquire()
+                    break
+                except Rejected as e:
+                    await asyncio.sleep(e.retry_after)
+        if self.draining:
+            self.admission.release()
+            raise Rejected("shutting_down", "Server is shutting down", 1.0)
+        try:
+            return await self.process_query(item["query"], conversation_id, item.get("server"))
+        finally:
+            self.admission.release()
+            self.conversations.clear(conversation_id)
 
-                if final_assistant_content:
-                    self.add_to_conversation_history(conversation_id, "assistant", final_assistant_content)
+    async def process_query(self, query: str, conversation_id: str = "console", preferred_server: str = None,
+                            on_event: Callable[[Dict[str, Any]], Awaitable[None]] = None) -> str:
+        """Process a query using available MCP servers"""
+        log.debug("Processing query for %s: %.200s", conversation_id, query)
+        
+        try:
+            with timed(self.stage_seconds, "history", stage="history"):
+                messages = self.get_conversation_history(conversation_id)
 
-                return "\n".join(final_texts) if final_texts else "Task completed."
+                user_message = {"role": "user", "content": query}
+                messages.append(user_message)
+                self.add_to_conversation_history(conversation_id, "user", query)
 
-            else:
+            with timed(self.stage_seconds, "tool_listing", stage="tool_listing"):
+                await self.tool_catalog.ensure_fresh(self._list_server_tools)
+            available_tools = self.tool_catalog.available_tools
+            tool_routes = self.tool_catalog.tool_routes
+            required_tools = referenced_tools(messages)
+            if mentions_stored_result(messages):
+                required_tools.add(READ_RESULT_TOOL)
+            route, model, max_tokens, tools = self.router.route(query, available_tools, required_tools)
+            self.routed_queries.inc(route=route, model=model)
+            # Leave tools out of the request entirely when the route offers none
+            tool_options = {"tools": self.with_tools_breakpoint(tools)} if tools else {}
+
+            if log.isEnabledFor(logging.DEBUG):
+                tool_names = [f"{tool['name']} ({tool_routes[tool['name']][0]})" for tool in tools]
+                log.debug("Route %s: model %s, max_tokens %s, tools %s", route, model, max_tokens, tool_names)
+                log.debug("Conversation history length: %s", len(messages))
+
+            started = time.monotonic()
+            total_tokens = 0
+            step = 0
+            while True:
+                step += 1
+                log.debug("Sending message with context to Claude (step %s)", step)
+                anthropic_response = await self.create_message(
+                    on_event=on_event,
+                    model=model,
+                    messages=self.with_cache_breakpoint(messages),
+                    max_tokens=max_tokens,
+                    **tool_options
+                )
+                usage = getattr(anthropic_response, "usage", None)
+                if usage:
+                    total_tokens += usage.input_tokens + usage.output_tokens
+                    self.record_prompt_cache_usage(conversation_id, usage)
+
+                log.debug("Claude response received with %s content blocks", len(anthropic_response.content))
+
+                assistant_content = []
+                tool_calls = []
                 final_texts = []
+
                 for content in anthropic_response.content:
                     if content.type == "text":
+                        log.debug("Text content: %.200s", content.text)
+                        assistant_content.append({"type": "text", "text": content.text})
                         final_texts.append(content.text)
-                
-                return "\n".join(final_texts) if final_texts else "No response generated."
+                    elif content.type == "tool_use":
+                        log.debug("Tool use: %s with input: %.200s", content.name, content.input)
+                        assistant_content.append({
+                            "type": "tool_use", 
+                            "id": content.id, 
+                            "name": content.name, 
+                            "input": content.input
+                        })
+                        tool_calls.append(content)
+
+                if not tool_calls:
+                    if assistant_content:
+                        with timed(self.stage_seconds, "history", stage="history"):
+                            self.add_to_conversation_history(conversation_id, "assistant", assistant_content)
+                    if final_texts:
+                        return "\n".join(final_texts)
+                    return "Task completed." if step > 1 else "No response generated."
+
+                messages.append({"role": "assistant", "content": assistant_content})
+                log.debug("Executing %s tool calls", len(tool_calls))
+                # The tool_use turn is stored only together with its results, so a cancelled or
+                # failed query never leaves a tool_use without a tool_result in the history
+                try:
+                    tool_results = await self.execute_tool_calls(tool_calls, tool_routes, preferred_server, on_event)
+                except BaseException as e:
+                    tool_results = [
+                        {"type": "tool_result", "tool_use_id": call.id, "is_error": True,
+                         "content": f"Error: tool call interrupted ({type(e).__name__})"}
+                        for call in tool_calls
+                    ]
+                    raise
+                finally:
+                    with timed(self.stage_seconds, "history", stage="history"):
+                        self.add_to_conversation_history(conversation_id, "assistant", assistant_content)
+                        self.add_to_conversation_history(conversation_id, "user", tool_results)
+                messages.append({"role": "user", "content": tool_results})
+
+                exhausted = self.exhausted_agent_budget(step, total_tokens, time.monotonic() - started)
+                if exhausted:
+                    log.info("Agent loop stopped after %s steps: %s budget exhausted", step, exhausted)
+                    notice = f"Stopped before finishing: the {exhausted} budget for this query was exhausted."
+                    self.add_to_conversation_history(conversation_id, "assistant", [{"type": "text", "text": notice}])
+                    return "\n".join(final_texts + [notice])
+
+                log.debug("Sending tool results to Claude")
 
         except Exception as e:
-            print(f"Error in process_query: {str(e)}")
+            log.exception("Error in process_query: %s", e)
             return f"Error processing query: {str(e)}"
 
+    def with_tools_breakpoint(self, tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Mark the last offered tool as a prompt cache breakpoint, reusing the catalog's copy for the full list"""
+        if not self.prompt_caching:
+            return tools
+        if tools is self.tool_catalog.available_tools:
+            return self.tool_catalog.cacheable_tools
+        return tools[:-1] + [dict(tools[-1], cache_control={"type": "ephemeral"})]
+
+    def with_cache_breakpoint(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Mark the end of the message list as a prompt cache breakpoint without touching stored history"""
+        if not self.prompt_caching or not messages:
+            return messages
+
+        last = messages[-1]
+        if isinstance(last["content"], str):
+            blocks = [{"type": "text", "text": last["content"]}]
+        else:
+            blocks = list(last["content"])
+        blocks[-1] = dict(blocks[-1], cache_control={"type": "ephemeral"})
+        return messages[:-1] + [{"role": last["role"], "content": blocks}]
+
+    def record_prompt_cache_usage(self, conversation_id: str, usage: Any):
+        """Accumulate cache read/write token counts for a conversation"""
+        stats = self.prompt_cache_stats.setdefault(conversation_id, {
+            "requests": 0,
+            "input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0
+        })
+        stats["requests"] += 1
+        stats["input_tokens"] += usage.input_tokens or 0
+        stats["cache_read_input_tokens"] += getattr(usage, "cache_read_input_tokens", None) or 0
+        stats["cache_creation_input_tokens"] += getattr(usage, "cache_creation_input_tokens", None) or 0
+
+    def exhausted_agent_budget(self, steps: int, total_tokens: int, elapsed: float) -> Optional[str]:
+        """Return the name of the first agent loop budget that has been used up, if any"""
+        if steps >= self.max_agent_steps:
+            return "step"
+        if self.max_agent_tokens and total_tokens >= self.max_agent_tokens:
+            return "token"
+        if self.max_agent_seconds and elapsed >= self.max_agent_seconds:
+            return "time"
+        return None
+
     async def chat_loop(self):
         """Interactive chat loop for console usage"""
         conversation_id = "console"
         print(f"\nUnified MCP Client Started!")
         print(f"Connected to servers: {list(self.connections.keys())}")
-        print("Type your queries, 'servers' to list servers, 'clear' to clear conversation history, or 'quit' to exit.")
+        print("Type your queries, 'servers' to list servers, 'refresh' to reload tools, 'cache' for prompt and tool result cache stats, 'clear' to clear conversation history, or 'quit' to exit.")
+        print("Manage servers with 'add <name> <server>', 'remove <name>' and 'reload' (re-reads --servers-file).")
         print(f"TCP server also listening on port {self.tcp_port}")
 
         while self.running:
             try:
-                query = await async_input("\nQuery: ")
+                try:
+                    query = await async_input("\nQuery: ")
+                except EOFError:
+                    log.info("Console input closed; serving TCP clients until shutdown")
+                    await self.shutdown_requested.wait()
+                    break
+                if not query.strip():
+                    continue
                 if query.lower() == "quit":
                     self.running = False
                     break
                 elif query.lower() == "clear":
-                    if conversation_id in self.conversation_history:
-                        del self.conversation_history[conversation_id]
+                    self.conversations.clear(conversation_id)
                     print("Conversation history cleared!")
                     continue
                 elif query.lower() == "servers":
                     print(f"Connected servers: {list(self.connections.keys())}")
-                    for name, conn in self.connections.items():
-                        print(f"  - {name} ({conn['type']})")
+                    for name in self.server_specs:
+                        print(f"  - {self.describe_server(name)}")
+                    continue
+                elif query.lower() == "cache":
+                    stats = self.prompt_cache_stats.get(conversation_id)
+                    print(f"Prompt cache ({'on' if self.prompt_caching else 'off'}): {stats or 'no requests yet'}")
+                    print(f"Tool result cache: {self.tool_result_cache.summary()}")
+                    continue
+                elif query.lower() == "reload":
+                    failed = await self.reload_from_file()
+                    if failed is not None:
+                        print(f"Servers: {list(self.server_specs)}" + (f", failed: {list(failed)}" if failed else ""))
+                    continue
+                elif query.lower().startswith(("add ", "remove ")):
+                    command, _, rest = query.partition(" ")
+                    name, _, spec = rest.strip().partition(" ")
+                    servers = dict(self.server_specs)
+                    if command.lower() == "add":
+                        if not spec.strip():
+                            print("Usage: add <name> <server>")
+                            continue
+                        servers[name] = spec.strip()
+                    elif servers.pop(name, None) is None:
+                        print(f"No server named {name}")
+                        continue
+                    failed = await self.reload_servers(servers)
+                    print(f"Servers: {list(self.server_specs)}" + (f", failed: {failed[name]!r}" if name in failed else ""))
+                    continue
+                elif query.lower() == "refresh":
+                    tools = await self.refresh_tools()
+                    print(f"Tool catalog refreshed: {[tool.name for tool in tools]}")
                     continue
                     
-                response = await self.process_query(query, conversation_id)
+                trace = start_trace()
+                await self.conversation_locks.acquire(conversation_id)
+                try:
+                    response = await self.process_query(query, conversation_id)
+                finally:
+                    self.conversation_locks.release(conversation_id)
+                log.info("console query conversation=%s %s", conversation_id, trace.summary())
                 print("\n" + response)
             except Exception as e:
                 print(f"\nError: {str(e)}")
 
+    def describe_server(self, server_name: str) -> str:
+        """One-line connection, health and pool summary for the servers command"""
+        conn = self.connections.get(server_name)
+        health = self.supervisor.state(server_name)
+        kind = conn["type"] if conn else detect_connection_type(self.server_specs[server_name])
+        parts = [f"{server_name} ({kind})", health["status"]]
+        if health["last_ping_ms"] is not None:
+            parts.append(f"ping {health['last_ping_ms']}ms")
+        if conn and conn["type"] == "remote":
+            parts.append(f"pool {len(conn['clients'])} sessions, in flight {conn['in_flight']}")
+        if health["reconnects"]:
+            parts.append(f"{health['reconnects']} reconnects")
+        if health["last_error"]:
+            parts.append(f"last error: {health['last_error']}")
+        return ", ".join(parts)
+
     async def run_with_tcp(self):
         """Run both console chat and TCP server concurrently"""
+        self.supervisor.start()
+        await self.start_metrics_server()
         await self.start_tcp_server()
         chat_task = asyncio.create_task(self.chat_loop())
         server_task = asyncio.create_task(self.tcp_server.serve_forever())
+        shutdown_task = asyncio.create_task(self.shutdown_requested.wait())
+        self.install_signal_handlers()
 
         try:
             done, pending = await asyncio.wait(
-                [chat_task, server_task],
+                [chat_task, server_task, shutdown_task],
                 return_when=asyncio.FIRST_COMPLETED
             )
 
+            # Cancelling serve_forever() waits for every client connection, so drain them first
+            await self.drain()
             for task in pending:
                 task.cancel()
                 try:
@@ -436,24 +1247,108 @@ class UnifiedMCPClient:
             print("\nShutting down...")
             self.running = False
 
-    async def cleanup(self):
-        self.running = False
+    def install_signal_handlers(self):
+        """SIGTERM and SIGINT drain and exit, SIGHUP reloads the servers file"""
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, self.request_shutdown)
+            loop.add_signal_handler(signal.SIGINT, self.request_shutdown)
+            loop.add_signal_handler(signal.SIGHUP, self.request_reload)
+        except (NotImplementedError, AttributeError):
+            # No signal handlers on this platform; quit and reload stay available from the console
+            pass
+
+    def request_shutdown(self):
+        """First signal starts a graceful drain, a second one cancels whatever is still running"""
+        if self.shutdown_requested.is_set():
+            log.warning("Second shutdown signal, cancelling %s in-flight requests", len(self.active_requests))
+            for task in list(self.active_requests):
+                task.cancel()
+            return
+        log.info("Shutdown requested, draining for up to %ss", self.drain_timeout)
+        self.shutdown_requested.set()
+
+    def request_reload(self):
+        if self.reload_task is None or self.reload_task.done():
+            self.reload_task = asyncio.create_task(self.reload_from_file())
+
+    async def drain(self, timeout: float = None):
+        """Stop accepting connections, let in-flight requests finish within timeout, then close client sockets"""
+        if self.draining:
+            return
+        self.draining = True
+        timeout = self.drain_timeout if timeout is None else timeout
         if self.tcp_server:
             self.tcp_server.close()
-            await self.tcp_server.wait_closed()
 
-        for conn in self.connections.values():
-            if conn["type"] == "remote" and "client" in conn:
-                await conn["client"].__aexit__(None, None, None)
-    
-        await self.exit_stack.aclose()
+        pending = {task for task in self.active_requests if not task.done()}
+        if pending:
+            log.info("Waiting for %s in-flight requests", len(pending))
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+        if pending:
+            log.warning("Cancelling %s requests still running after %ss", len(pending), timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        # Idle connections would otherwise keep wait_closed() waiting forever on Python 3.12+
+        for writer in list(self.tcp_writers):
+            writer.close()
+        if self.tcp_server:
+            try:
+                await asyncio.wait_for(self.tcp_server.wait_closed(), timeout=5.0)
+            except asyncio.TimeoutError:
+                log.warning("TCP server did not close within 5s")
+
+    async def cleanup(self):
+        await self.drain()
+        self.running = False
+        await self.supervisor.stop()
+        await self.tool_catalog.close()
+        if self.reload_task:
+            await asyncio.gather(self.reload_task, return_exceptions=True)
+        await asyncio.gather(*self.retiring, return_exceptions=True)
+        if self.metrics_server:
+            self.metrics_server.close()
+
+        await asyncio.gather(*(self.disconnect_server(name) for name in list(self.connections)))
+        await self.anthropic.close()
+        self.conversations.close()
+        if self.result_normalizer.store:
+            self.result_normalizer.store.close()
 
 
 async def async_input(prompt: str = "") -> str:
     """Async input function"""
     print(prompt, end="", flush=True)
-    loop = asyncio.get_event_loop()
-    return (await loop.run_in_executor(None, sys.stdin.readline)).rstrip()
+    loop = asyncio.get_running_loop()
+    line = loop.create_future()
+
+    def read():
+        text = sys.stdin.readline()
+        if not text:
+            text = None
+        try:
+            loop.call_soon_threadsafe(lambda: line.done() or line.set_result(text))
+        except RuntimeError:
+            pass
+
+    # A daemon thread, unlike the default executor, does not hold up interpreter exit while blocked on stdin
+    threading.Thread(target=read, daemon=True).start()
+    text = await line
+    if text is None:
+        raise EOFError
+    return text.rstrip()
+
+def load_servers_file(path: str) -> Dict[str, str]:
+    """Read {"name": "server spec"} from a JSON file; a plain list gets file_1, file_2, ... names"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {f"file_{i + 1}": spec for i, spec in enumerate(data)}
+    if not isinstance(data, dict) or not all(isinstance(spec, str) and spec for spec in data.values()):
+        raise ValueError("servers file must hold a JSON object of name to server spec, or a list of specs")
+    return data
 
 def detect_connection_type(server_arg: str) -> str:
     """Detect if the server argument is a URL (remote) or script path (local)"""
@@ -463,16 +1358,20 @@ def detect_connection_type(server_arg: str) -> str:
         return 'local'
 
 async def main():
-    if len(sys.argv) < 2:
-        print("Usage: python unified_client.py <server1> [server2] [server3] ... [--tcp-port PORT]")
+    if len(sys.argv) < 2 and not os.getenv("SERVERS_FILE"):
+        print("Usage: python unified_client.py <server1> [server2] [server3] ... [--tcp-port PORT] [--lazy] [--servers-file PATH]")
         print("\nExamples:")
         print("  Single server:    python unified_client.py mcp-server-git")
         print("  Multiple servers: python unified_client.py mcp-server-git server.py http://localhost:8080/mcp")
         print("  With TCP port:    python unified_client.py mcp-server-git --tcp-port 9090")
+        print("  Lazy connections: python unified_client.py mcp-server-git server.py --lazy")
+        print("  Reloadable list:  python unified_client.py --servers-file servers.json  (kill -HUP to reload)")
         sys.exit(1)
 
     servers = []
     tcp_port = 8080
+    lazy = False
+    servers_file = os.getenv("SERVERS_FILE") or None
     
     args = sys.argv[1:]
     i = 0
@@ -480,27 +1379,41 @@ async def main():
         if args[i] == '--tcp-port' and i + 1 < len(args):
             tcp_port = int(args[i + 1])
             i += 2
+        elif args[i] == '--lazy':
+            lazy = True
+            i += 1
+        elif args[i] == '--servers-file' and i + 1 < len(args):
+            servers_file = args[i + 1]
+            i += 2
         else:
             servers.append(args[i])
             i += 1
     
-    if not servers:
+    if not servers and not servers_file:
         print("Error: At least one server must be specified")
         sys.exit(1)
     
     client = UnifiedMCPClient(tcp_port=tcp_port)
+    setup_logging(
+        os.getenv("LOG_LEVEL", "INFO"),
+        burst=env_int("LOG_RATE_LIMIT", 20),
+        interval=env_float("LOG_RATE_INTERVAL", 10.0),
+        on_suppress=lambda record: client.log_suppressed.inc(logger=record.name)
+    )
     
     try:
+        server_specs = {}
         for i, server_arg in enumerate(servers):
-            connection_type = detect_connection_type(server_arg)
             server_name = f"server_{i+1}" if len(servers) > 1 else "default"
-            
-            if connection_type == 'local':
-                print(f"Connecting to LOCAL server {server_name}: {server_arg}")
-                await client.connect_to_local_server(server_name, server_arg)
-            else:
-                print(f"Connecting to REMOTE server {server_name}: {server_arg}")
-                await client.connect_to_remote_server(server_name, server_arg)
+            server_specs[server_name] = server_arg
+        client.base_servers = dict(server_specs)
+        if servers_file:
+            client.servers_file = servers_file
+            server_specs = client.with_base_servers(load_servers_file(servers_file))
+
+        failed = await client.connect_servers(server_specs, lazy=lazy)
+        if len(failed) == len(server_specs):
+            log.warning("No MCP server could be connected")
             
         await client.run_with_tcp()
     finally:
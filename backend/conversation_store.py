@@ -0,0 +1,253 @@
+import json
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+# The API scales images down to about 1.15 megapixels, roughly 1600 tokens, whatever their encoded size
+IMAGE_TOKENS = 1600
+
+
+def estimate_tokens(content: Any) -> int:
+    """Cheap token estimate (~4 characters per token) for a message's content, counting images by their fixed cost"""
+    if isinstance(content, str):
+        return len(content) // 4 + 1
+    if isinstance(content, list):
+        return sum(block_tokens(block) for block in content) + 1
+    return len(json.dumps(content, ensure_ascii=False, default=str)) // 4 + 1
+
+
+def block_tokens(block: Any) -> int:
+    """Token estimate of one content block; base64 image data is never counted as text"""
+    if isinstance(block, dict):
+        if block.get("type") == "image":
+            return IMAGE_TOKENS
+        if block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+            rest = {key: value for key, value in block.items() if key != "content"}
+            return estimate_tokens(block["content"]) + len(json.dumps(rest, ensure_ascii=False, default=str)) // 4
+    return len(json.dumps(block, ensure_ascii=False, default=str)) // 4
+
+
+def starts_turn(message: Dict[str, Any]) -> bool:
+    """A turn starts with a user message that is not a list of tool results"""
+    if message["role"] != "user":
+        return False
+    content = message["content"]
+    if isinstance(content, list):
+        return not any(isinstance(block, dict) and block.get("type") == "tool_result" for block in content)
+    return True
+
+
+class Conversation:
+    """Messages of one conversation with their token estimates and persistence sequence numbers"""
+
+    def __init__(self):
+        self.messages: Deque[Dict[str, Any]] = deque()
+        self.tokens: Deque[int] = deque()
+        self.seqs: Deque[int] = deque()
+        self.total_tokens = 0
+        self.next_seq = 0
+        self.last_access = time.monotonic()
+
+    def append(self, message: Dict[str, Any], seq: int = None):
+        tokens = estimate_tokens(message["content"])
+        self.messages.append(message)
+        self.tokens.append(tokens)
+        self.seqs.append(self.next_seq if seq is None else seq)
+        self.next_seq = self.seqs[-1] + 1
+        self.total_tokens += tokens
+
+    def pop_turn(self) -> bool:
+        """Drop the oldest turn (user message plus the replies and tool pairs that follow it)"""
+        boundary = next((i for i, message in enumerate(self.messages) if i > 0 and starts_turn(message)), None)
+        if boundary is None:
+            return False
+        for _ in range(boundary):
+            self.messages.popleft()
+            self.seqs.popleft()
+            self.total_tokens -= self.tokens.popleft()
+        return True
+
+
+class ConversationStore:
+    """Bounded conversation histories with LRU/TTL eviction and optional SQLite persistence
+
+    SQLite is queried synchronously on the caller's thread. Each call is a small indexed query on a local
+    WAL database, so the gateway runs them on the event loop; a slow or network-mounted HISTORY_DB stalls it.
+    """
+
+    def __init__(self, max_tokens_per_conversation: int = 8000, max_conversations: int = 1000,
+                 max_total_tokens: int = 2_000_000, ttl: float = 3600.0, db_path: str = None,
+                 on_evict: Callable[[str], None] = None):
+        self.max_tokens_per_conversation = max_tokens_per_conversation
+        self.max_conversations = max_conversations
+        self.max_total_tokens = max_total_tokens
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self.total_tokens = 0
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, "
+                "content TEXT NOT NULL, PRIMARY KEY (conversation_id, seq))"
+            )
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self.conversations or self._persisted_seq(conversation_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.conversations)
+
+    def get(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Return the messages of a conversation, oldest first"""
+        conversation = self._touch(conversation_id, create=False)
+        return list(conversation.messages) if conversation else []
+
+    def append(self, conversation_id: str, role: str, content: Any):
+        """Append a message and trim the conversation to its token budget"""
+        conversation = self._touch(conversation_id, create=True)
+        message = {"role": role, "content": content}
+        if self.db:
+            conversation = self._insert(conversation_id, conversation, message)
+        before = conversation.total_tokens
+        conversation.append(message)
+
+        trimmed = False
+        while conversation.total_tokens > self.max_tokens_per_conversation and conversation.pop_turn():
+            trimmed = True
+        if trimmed and self.db:
+            self.db.execute(
+                "DELETE FROM messages WHERE conversation_id = ? AND seq < ?",
+                (conversation_id, conversation.seqs[0])
+            )
+
+        self.total_tokens += conversation.total_tokens - before
+        self._enforce_limits(keep=conversation_id)
+
+    def cursor(self, conversation_id: str) -> int:
+        """Sequence number the next message of a conversation will get"""
+        conversation = self.conversations.get(conversation_id)
+        if conversation is not None:
+            return conversation.next_seq
+        persisted = self._persisted_seq(conversation_id)
+        return persisted + 1 if persisted is not None else 0
+
+    def since(self, conversation_id: str, cursor: int) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """Messages with a sequence number >= cursor, the new cursor, and whether older ones were trimmed away"""
+        conversation = self._touch(conversation_id, create=False)
+        if conversation is None:
+            return [], 0, False
+
+        newer = []
+        for seq, message in zip(reversed(conversation.seqs), reversed(conversation.messages)):
+            if seq < cursor:
+                break
+            newer.append(dict(message, seq=seq))
+        newer.reverse()
+
+        truncated = bool(conversation.seqs) and conversation.seqs[0] > cursor
+        return newer, conversation.next_seq, truncated
+
+    def clear(self, conversation_id: str):
+        """Forget a conversation, in memory and on disk"""
+        self._evict(conversation_id)
+        if self.db:
+            self.db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    def _touch(self, conversation_id: str, create: bool) -> Optional[Conversation]:
+        self._evict_expired()
+        conversation = self.conversations.get(conversation_id)
+
+        if self.db:
+            persisted = self._persisted_seq(conversation_id)
+            if persisted is None:
+                if conversation is not None and conversation.messages:
+                    self._evict(conversation_id)
+                    conversation = None
+            elif conversation is None or conversation.next_seq != persisted + 1:
+                conversation = self._load(conversation_id)
+
+        if conversation is None:
+            if not create:
+                return None
+            conversation = Conversation()
+            self.conversations[conversation_id] = conversation
+
+        conversation.last_access = time.monotonic()
+        self.conversations.move_to_end(conversation_id)
+        return conversation
+
+    def _insert(self, conversation_id: str, conversation: Conversation, message: Dict[str, Any]) -> Conversation:
+        """Write a message under the next sequence number, reloading when another gateway took that number first"""
+        content = json.dumps(message["content"], ensure_ascii=False, default=str)
+        while True:
+            try:
+                self.db.execute(
+                    "INSERT INTO messages (conversation_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    (conversation_id, conversation.next_seq, message["role"], content)
+                )
+                return conversation
+            except sqlite3.IntegrityError:
+                conversation = self._load(conversation_id)
+
+    def _persisted_seq(self, conversation_id: str) -> Optional[int]:
+        if not self.db:
+            return None
+        row = self.db.execute("SELECT MAX(seq) FROM messages WHERE conversation_id = ?", (conversation_id,)).fetchone()
+        return row[0]
+
+    def _load(self, conversation_id: str) -> Conversation:
+        """(Re)load a conversation from disk, e.g. after eviction, a restart or a write by another gateway"""
+        if conversation_id in self.conversations:
+            self.total_tokens -= self.conversations[conversation_id].total_tokens
+
+        conversation = Conversation()
+        rows = self.db.execute(
+            "SELECT seq, role, content FROM messages WHERE conversation_id = ? ORDER BY seq",
+            (conversation_id,)
+        )
+        for seq, role, content in rows:
+            conversation.append({"role": role, "content": json.loads(content)}, seq)
+
+        self.conversations[conversation_id] = conversation
+        self.total_tokens += conversation.total_tokens
+        return conversation
+
+    def _evict(self, conversation_id: str):
+        conversation = self.conversations.pop(conversation_id, None)
+        if conversation is None:
+            return
+        self.total_tokens -= conversation.total_tokens
+        if self.on_evict:
+            self.on_evict(conversation_id)
+
+    def _evict_expired(self):
+        if self.ttl <= 0:
+            return
+        cutoff = time.monotonic() - self.ttl
+        while self.conversations:
+            oldest_id, oldest = next(iter(self.conversations.items()))
+            if oldest.last_access > cutoff:
+                break
+            self._evict(oldest_id)
+
+    def _enforce_limits(self, keep: str):
+        while self.conversations and (
+            len(self.conversations) > self.max_conversations or self.total_tokens > self.max_total_tokens
+        ):
+            oldest_id = next(iter(self.conversations))
+            if oldest_id == keep:
+                break
+            self._evict(oldest_id)
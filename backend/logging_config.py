@@ -0,0 +1,68 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Dict, Tuple
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `burst` records per message template every `interval` seconds
+
+    Dropped records are counted and reported on the next record of that template that gets through.
+    Warnings and errors are never dropped.
+    """
+
+    def __init__(self, burst: int = 20, interval: float = 10.0, on_suppress=None):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.on_suppress = on_suppress
+        self.windows: Dict[Tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            window = self.windows[key] = [now, 0, 0]
+            if suppressed:
+                record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+
+        if window[1] >= self.burst:
+            window[2] += 1
+            if self.on_suppress:
+                self.on_suppress(record)
+            return False
+        window[1] += 1
+        return True
+
+
+def setup_logging(level: str = "INFO", burst: int = 20, interval: float = 10.0, on_suppress=None):
+    """Route log records through a queue so formatting and stderr writes happen off the event loop"""
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(RateLimitFilter(burst, interval, on_suppress))
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(records, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    # Keep third-party request logging out of the gateway's output unless asked for
+    for noisy in ("httpx", "httpx2", "httpcore", "mcp", "anthropic"):
+        logging.getLogger(noisy).setLevel(max(root.level, logging.WARNING))
+    return listener
@@ -0,0 +1,219 @@
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (),
+                 collect: Callable[[], Iterable[Tuple[Dict[str, Any], float]]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.collect = collect
+
+    def key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+    def samples(self) -> List[str]:
+        values = dict(self.values)
+        if self.collect:
+            values.update((self.key(labels), value) for labels, value in self.collect())
+        return [f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"
+                for key, value in values.items()]
+
+
+class Counter(Metric):
+    """Monotonic counter, one series per label combination, optionally read from collect() at scrape time"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Point-in-time value, either set directly or read from collect() at scrape time"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self.key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Cumulative-bucket latency histogram, one series per label combination"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        series = self.series.get(key)
+        if series is None:
+            # one count per bucket, then +Inf, sum and count
+            series = self.series[key] = [0] * (len(self.buckets) + 3)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, key)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = (), collect=None) -> Counter:
+        return self.metrics.get(name) or self.register(Counter(name, help_text, labels, collect))
+
+    def gauge(self, name: str, help_text: str, labels: Iterable[str] = (), collect=None) -> Gauge:
+        return self.metrics.get(name) or self.register(Gauge(name, help_text, labels, collect))
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.metrics.get(name) or self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    """Per-request totals of time spent in each stage, shared by the tasks serving that request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, seconds: float):
+        totals = self.stages.setdefault(stage, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        parts = [f"total={self.elapsed():.3f}s"]
+        parts.extend(f"{stage}={seconds:.3f}s/{count}" for stage, (seconds, count) in self.stages.items())
+        return " ".join(parts)
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+def start_trace() -> RequestTrace:
+    """Begin a trace for the current request; tasks spawned afterwards inherit it"""
+    trace = RequestTrace()
+    current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def timed(histogram: Histogram, trace_as: str = None, **labels):
+    """Observe the duration of a block, adding it to the request trace under trace_as when given
+
+    The yielded dict can be updated with label values that are only known at the end of the block;
+    a "status" label becomes "error" when the block raises.
+    """
+    started = time.perf_counter()
+    labels = dict(labels)
+    if "status" in histogram.label_names:
+        labels.setdefault("status", "ok")
+    try:
+        yield labels
+    except BaseException:
+        if "status" in histogram.label_names:
+            labels["status"] = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        histogram.observe(seconds, **labels)
+        trace = current_trace.get()
+        if trace_as and trace is not None:
+            trace.add(trace_as, seconds)
+
+
+async def start_metrics_server(registry: MetricsRegistry, host: str, port: int) -> asyncio.AbstractServer:
+    """Serve GET /metrics in the Prometheus text format"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", registry.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"content-type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"content-length: {len(body)}\r\n"
+                f"connection: close\r\n"
+                f"\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+log = logging.getLogger("gateway.routing")
+
+TOOL_MODES = ("all", "none", "matched", "matched_or_all")
+STOPWORDS = frozenset(
+    "the and for with that this from into your you are was were can could would should will what when where which "
+    "who how why about have has had does did not but all any some use using get set list show tell give make please "
+    "its it's then than them they their there here also just like want need".split()
+)
+
+
+def words(text: str) -> Set[str]:
+    """Lowercase words of at least three letters, split on snake_case and camelCase, without a plural s"""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "")
+    found = set()
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        found.add(word[:-1] if len(word) > 3 and word.endswith("s") else word)
+    return found
+
+
+def referenced_tools(messages: List[Dict[str, Any]]) -> Set[str]:
+    """Names of tools called earlier in the conversation; the API needs them defined to accept the history"""
+    names = set()
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            names.update(block["name"] for block in content if isinstance(block, dict) and block.get("type") == "tool_use")
+    return names
+
+
+def load_routing_policy(spec: str) -> Dict[str, Any]:
+    """Read a routing policy given inline as JSON or as the path of a JSON file"""
+    if not spec:
+        return {}
+    if spec.lstrip().startswith("{"):
+        return json.loads(spec)
+    with open(os.path.expanduser(spec), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Route:
+    """One policy entry: conditions on the query, and the settings used when all of them hold"""
+
+    def __init__(self, name: str, model: str = None, max_tokens: int = None, tools: str = None,
+                 keywords: Iterable[str] = (), pattern: str = None, min_chars: int = None, max_chars: int = None,
+                 tool_match: bool = None):
+        if tools is not None and tools not in TOOL_MODES:
+            raise ValueError(f"Unknown tools mode {tools!r} in route {name!r}, expected one of {TOOL_MODES}")
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.tools = tools
+        self.keywords = set().union(*(words(keyword) for keyword in keywords)) if keywords else set()
+        self.pattern = re.compile(pattern, re.IGNORECASE) if pattern else None
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.tool_match = tool_match
+
+    def matches(self, query: str, query_words: Set[str], tools_matched: bool) -> bool:
+        if self.keywords and not self.keywords & query_words:
+            return False
+        if self.pattern and not self.pattern.search(query):
+            return False
+        if self.min_chars is not None and len(query) < self.min_chars:
+            return False
+        if self.max_chars is not None and len(query) > self.max_chars:
+            return False
+        return self.tool_match is None or self.tool_match == tools_matched
+
+
+class ModelRouter:
+    """Chooses the model, max_tokens and the tools to offer for each query from a deployment policy
+
+    Tools match a query when its words overlap a tool's name (2 points per word), its description
+    (1 point) or the extra keywords given for it in the policy (2 points), reaching `tool_min_score`.
+    Routes are tried in order and the first one whose conditions hold overrides the defaults.
+    """
+
+    def __init__(self, model: str, max_tokens: int, tools: str = "all", routes: List[Route] = None,
+                 tool_keywords: Dict[str, List[str]] = None, tool_min_score: int = 2, unmatched_tools: Iterable[str] = ()):
+        if tools not in TOOL_MODES:
+            raise ValueError(f"Unknown tools mode {tools!r}, expected one of {TOOL_MODES}")
+        self.model = model
+        self.max_tokens = max_tokens
+        self.tools = tools
+        self.routes = list(routes or [])
+        self.tool_keywords = {name: set().union(*(words(k) for k in keywords)) for name, keywords in (tool_keywords or {}).items()}
+        self.tool_min_score = tool_min_score
+        # Offered only in "all" mode or when required, never because of the words of a query
+        self.unmatched_tools = set(unmatched_tools)
+        self._indexed_tools: Optional[List[Dict[str, Any]]] = None
+        self._index: List[Tuple[Set[str], Set[str], Set[str]]] = []
+
+    @classmethod
+    def from_policy(cls, policy: Dict[str, Any], model: str, max_tokens: int, unmatched_tools: Iterable[str] = ()) -> "ModelRouter":
+        """Build a router from a policy dict; settings it leaves out keep the given defaults"""
+        routes = [Route(**dict(route, name=route.get("name", f"route{i}"))) for i, route in enumerate(policy.get("routes", []))]
+        return cls(
+            model=policy.get("model", model),
+            max_tokens=policy.get("max_tokens", max_tokens),
+            tools=policy.get("tools", "all"),
+            routes=routes,
+            tool_keywords=policy.get("tool_keywords"),
+            tool_min_score=policy.get("tool_min_score", 2),
+            unmatched_tools=unmatched_tools
+        )
+
+    def index(self, available_tools: List[Dict[str, Any]]) -> List[Tuple[Set[str], Set[str], Set[str]]]:
+        """Word sets per tool, rebuilt only when the catalog hands out a new tool list"""
+        if available_tools is not self._indexed_tools:
+            self._index = [
+                (words(tool["name"]), words(tool.get("description") or ""), self.keywords_for(tool["name"]))
+                for tool in available_tools
+            ]
+            self._indexed_tools = available_tools
+        return self._index
+
+    def keywords_for(self, tool_name: str) -> Set[str]:
+        """Policy keywords for a tool, by exposed name or by the part after a server__ prefix"""
+        return self.tool_keywords.get(tool_name) or self.tool_keywords.get(tool_name.rpartition("__")[2]) or set()
+
+    def match_tools(self, query_words: Set[str], available_tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        matched = []
+        for tool, (name_words, description_words, keywords) in zip(available_tools, self.index(available_tools)):
+            if tool["name"] in self.unmatched_tools:
+                continue
+            score = 2 * len(query_words & name_words) + len(query_words & description_words) + 2 * len(query_words & keywords)
+            if score >= self.tool_min_score:
+                matched.append(tool)
+        return matched
+
+    def route(self, query: str, available_tools: List[Dict[str, Any]],
+              required_tools: Set[str] = frozenset()) -> Tuple[str, str, int, List[Dict[str, Any]]]:
+        """Return (route name, model, max_tokens, tools) for a query"""
+        query_words = words(query)
+        matched = self.match_tools(query_words, available_tools) if self.tools != "all" or self.routes else available_tools
+        route = next((r for r in self.routes if r.matches(query, query_words, bool(matched))), None)
+
+        mode = (route.tools if route and route.tools else None) or self.tools
+        if mode == "all" or (mode == "matched_or_all" and not matched):
+            tools = available_tools
+        elif mode == "none":
+            tools = []
+        else:
+            tools = matched
+
+        if required_tools and tools is not available_tools:
+            selected = {tool["name"] for tool in tools}
+            tools = tools + [tool for tool in available_tools if tool["name"] in required_tools and tool["name"] not in selected]
+
+        return (
+            route.name if route else "default",
+            (route.model if route else None) or self.model,
+            (route.max_tokens if route else None) or self.max_tokens,
+            tools
+        )
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryPool:
+    """Jokes of one category in serving rotation, plus the ones retired recently"""
+
+    def __init__(self, history_size: int):
+        self.jokes: Deque[List] = deque()
+        self.retired: Deque[str] = deque(maxlen=history_size)
+        self.seen: Set[str] = set()
+        self.refill_task: Optional[asyncio.Task] = None
+        self.ready = asyncio.Event()
+
+    def add(self, joke: str) -> bool:
+        key = normalize_joke(joke)
+        if not key or key in self.seen:
+            return False
+        self.seen.add(key)
+        self.jokes.append([joke, 0])
+        return True
+
+    def take(self, max_serves: int) -> Optional[str]:
+        """Serve the next joke in rotation, retiring it once it has been told max_serves times"""
+        if not self.jokes:
+            return None
+        entry = self.jokes.popleft()
+        entry[1] += 1
+        if entry[1] >= max_serves:
+            self.retire(entry[0])
+        else:
+            self.jokes.append(entry)
+        return entry[0]
+
+    def retire(self, joke: str):
+        if len(self.retired) == self.retired.maxlen:
+            self.seen.discard(normalize_joke(self.retired[0]))
+        self.retired.append(joke)
+
+
+def normalize_joke(joke: str) -> str:
+    return " ".join(joke.lower().split())
+
+
+def normalize_category(category: str) -> str:
+    return " ".join((category or "general").lower().split())[:50] or "general"
+
+
+class JokePool:
+    """Per-category pools of pre-generated jokes, refilled in the background
+
+    Jokes are served once by default, or round-robin up to `max_serves` times; a category is topped back
+    up to `size` when it drops to `low_water`, with at most `refill_concurrency` model calls in flight
+    across all categories. Jokes among the last `history_size` retired ones are not accepted again.
+    """
+
+    def __init__(self, generate: Callable[[str, int], Awaitable[List[str]]], size: int = 10, low_water: int = 3,
+                 batch_size: int = 5, refill_concurrency: int = 2, max_categories: int = 100, history_size: int = 50,
+                 max_serves: int = 1):
+        self.generate = generate
+        self.size = size
+        self.max_serves = max(max_serves, 1)
+        self.low_water = low_water
+        self.batch_size = batch_size
+        self.refill_semaphore = asyncio.Semaphore(max(refill_concurrency, 1))
+        self.max_categories = max_categories
+        self.history_size = history_size
+        self.categories: "OrderedDict[str, CategoryPool]" = OrderedDict()
+        self.stats = {"served": 0, "pool_hits": 0, "cold_misses": 0, "model_calls": 0, "duplicates": 0}
+
+    def pool(self, category: str) -> CategoryPool:
+        pool = self.categories.get(category)
+        if pool is None:
+            pool = self.categories[category] = CategoryPool(self.history_size)
+            while len(self.categories) > self.max_categories:
+                evicted, old = self.categories.popitem(last=False)
+                if old.refill_task:
+                    old.refill_task.cancel()
+                logger.info(f"Evicted joke pool for category '{evicted}'")
+        self.categories.move_to_end(category)
+        return pool
+
+    async def get(self, category: str) -> Optional[str]:
+        """Serve a joke from memory, waiting for a first batch only when the category is cold"""
+        category = normalize_category(category)
+        pool = self.pool(category)
+        joke = pool.take(self.max_serves)
+        if joke is None:
+            self.stats["cold_misses"] += 1
+            await self.wait_for_batch(category, pool)
+            joke = pool.take(self.max_serves)
+        else:
+            self.stats["pool_hits"] += 1
+
+        if len(pool.jokes) <= self.low_water:
+            self.schedule_refill(category, pool)
+        if joke is not None:
+            self.stats["served"] += 1
+        return joke
+
+    async def wait_for_batch(self, category: str, pool: CategoryPool):
+        """Wait until the category has a joke or its refill gave up, without cancelling the refill"""
+        refill = self.schedule_refill(category, pool)
+        while not pool.jokes and not refill.done():
+            pool.ready.clear()
+            ready = asyncio.create_task(pool.ready.wait())
+            try:
+                await asyncio.wait({refill, ready}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                ready.cancel()
+
+    def schedule_refill(self, category: str, pool: CategoryPool) -> asyncio.Task:
+        """Start a refill for the category unless one is already running"""
+        if pool.refill_task is None or pool.refill_task.done():
+            pool.refill_task = asyncio.create_task(self.refill(category, pool))
+        return pool.refill_task
+
+    async def refill(self, category: str, pool: CategoryPool):
+        attempts = 0
+        while len(pool.jokes) < self.size and attempts < 3:
+            attempts += 1
+            async with self.refill_semaphore:
+                self.stats["model_calls"] += 1
+                try:
+                    jokes = await self.generate(category, self.batch_size)
+                except Exception as e:
+                    logger.warning(f"Generating jokes about '{category}' failed: {e}")
+                    return
+            added = sum(pool.add(joke) for joke in jokes)
+            self.stats["duplicates"] += len(jokes) - added
+            if added:
+                attempts = 0
+                pool.ready.set()
+
+    async def warm(self, categories: List[str]):
+        """Pre-generate pools for popular categories"""
+        await asyncio.gather(*(
+            self.schedule_refill(normalize_category(c), self.pool(normalize_category(c))) for c in categories
+        ), return_exceptions=True)
@@ -1,48 +1,117 @@
 import asyncio
 import logging
 import os
+import re
+from contextlib import asynccontextmanager
 
-from fastmcp import FastMCP 
-from anthropic import Anthropic
+import httpx
+import uvicorn
+from fastmcp import FastMCP
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from joke_pool import JokePool
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(format="[%(levelname)s]: %(message)s", level=logging.INFO)
+# One line per model request drowns everything else under load
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def worker_count() -> int:
+    """WORKERS from the environment; "auto" uses every CPU this process may run on"""
+    workers = os.getenv("WORKERS", "1")
+    if workers == "auto":
+        return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(int(workers), 1)
+
+
+WORKERS = worker_count()
+
+# Sessions live in process memory, so with several workers every request must stand alone
+mcp = FastMCP("MCP Server on Cloud Run", stateless_http=WORKERS > 1)
+
+# One client per worker process, sharing a bounded keep-alive pool for all model calls
+anthropic = AsyncAnthropic(
+    api_key=os.getenv("ANTHROPIC_API_KEY"),
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("MODEL_MAX_CONNECTIONS", 20)),
+            max_keepalive_connections=int(os.getenv("MODEL_MAX_CONNECTIONS", 20)),
+        )
+    ),
+)
+
+
+async def generate_jokes(category: str, count: int) -> list[str]:
+    prompt = (
+        f"Tell me {count} different short and funny jokes about {category}. "
+        "Write each joke on a single line, with no numbering and nothing else."
+    )
+    response = await anthropic.messages.create(
+        model="claude-3-haiku-20240307",
+        max_tokens=80 * count,
+        messages=[{"role": "user", "content": prompt}]
+    )
 
-mcp = FastMCP("MCP Server on Cloud Run")
-anthropic = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    text = "".join(block.text for block in response.content if block.type == "text")
+    lines = (re.sub(r"^\s*(?:\d+[.)]|[-*•])\s*", "", line).strip() for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+# Jokes are generated in batches ahead of time; tool calls are served from memory.
+# JOKE_REFILL_CONCURRENCY caps model calls for the whole instance, so each worker gets a share of it
+joke_pool = JokePool(
+    generate_jokes,
+    size=int(os.getenv("JOKE_POOL_SIZE", 10)),
+    low_water=int(os.getenv("JOKE_POOL_LOW_WATER", 3)),
+    batch_size=int(os.getenv("JOKE_BATCH_SIZE", 5)),
+    refill_concurrency=max(int(os.getenv("JOKE_REFILL_CONCURRENCY", 2)) // WORKERS, 1),
+    max_categories=int(os.getenv("JOKE_MAX_CATEGORIES", 100)),
+    max_serves=int(os.getenv("JOKE_MAX_SERVES", 1)),
+)
 
 @mcp.tool()
-def tell_joke(category: str = "general") -> str:
+async def tell_joke(category: str = "general") -> str:
     """Tell a short and funny joke.
-    
+
     Args:
         category: optional category for the joke
     """
-    prompt = f"Tell me a short and funny joke about {category}."
-    response = anthropic.messages.create(
-        model="claude-3-haiku-20240307",
-        max_tokens=80,
-        messages=[{"role": "user", "content": prompt}]
-    )
+    joke = await joke_pool.get(category)
+    return joke if joke else "I couldn't make a joke."
 
-    joke = ""
-    for block in response.content:
-        if block.type == "text":
-            joke += block.text.strip()
 
-    return joke if joke else "I couldn't make a joke."
+mcp_app = mcp.http_app()
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    """Warm the joke pool of this worker while the MCP app serves requests"""
+    preload = [c for c in os.getenv("JOKE_PRELOAD_CATEGORIES", "general").split(",") if c.strip()]
+    warm_task = asyncio.create_task(joke_pool.warm(preload))
+    async with mcp_app.lifespan(app):
+        yield
+    warm_task.cancel()
+    await anthropic.close()
+
+
+# Imported by every uvicorn worker when WORKERS > 1
+app = Starlette(routes=[Mount("/", app=mcp_app)], lifespan=lifespan)
 
 if __name__ == "__main__":
-    logger.info(f" MCP server started on port {os.getenv('PORT', 8090)}")
+    port = int(os.getenv("PORT", 8090))
+    logger.info(f" MCP server started on port {port} with {WORKERS} worker(s)")
     # Could also use 'sse' transport, host="0.0.0.0" required for Cloud Run.
-    asyncio.run(
-        mcp.run_async(
-            transport="streamable-http", 
-            host="0.0.0.0", 
-            port=os.getenv("PORT", 8090),
-        )
+    uvicorn.run(
+        "server:app" if WORKERS > 1 else app,
+        host="0.0.0.0",
+        port=port,
+        workers=WORKERS,
+        # Cloud Run allows 10 seconds after SIGTERM; let in-flight tool calls finish within that
+        timeout_graceful_shutdown=int(os.getenv("SHUTDOWN_GRACE_SECONDS", 5)),
     )
-
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict
+
+log = logging.getLogger("gateway.supervisor")
+
+# A server that answers "method not found" to ping is still alive and reachable
+METHOD_NOT_FOUND = -32601
+
+
+class ConnectionSupervisor:
+    """Health-checks MCP server connections and reconnects failed ones with exponential backoff"""
+
+    def __init__(self, client: Any, interval: float = 30.0, ping_timeout: float = 5.0,
+                 min_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.client = client
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.health: Dict[str, Dict[str, Any]] = {}
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def state(self, server_name: str) -> Dict[str, Any]:
+        return self.health.setdefault(server_name, {
+            "status": "unknown",
+            "last_ping_ms": None,
+            "failures": 0,
+            "reconnects": 0,
+            "backoff": 0.0,
+            "next_attempt": 0.0,
+            "last_error": None
+        })
+
+    def report_failure(self, server_name: str):
+        """Ask for an early health check, e.g. after a failed tool call"""
+        self.state(server_name)["status"] = "suspect"
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self._next_delay())
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.check_all()
+
+    def _next_delay(self) -> float:
+        now = time.monotonic()
+        retries = [state["next_attempt"] - now for state in self.health.values() if state["status"] == "unhealthy"]
+        return max(min([self.interval] + retries), 0.1)
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(name) for name in list(self.client.server_specs)), return_exceptions=True)
+
+    async def check(self, server_name: str):
+        """Ping one server and reconnect it when the ping fails or its transport has died"""
+        state = self.state(server_name)
+        if server_name in self.client.lazy_servers and server_name not in self.client.connections:
+            state["status"] = "lazy"
+            return
+
+        error = await self.ping(server_name)
+        if error is None:
+            state.update(status="healthy", failures=0, backoff=0.0, last_error=None)
+            return
+
+        state["failures"] += 1
+        state["last_error"] = error
+        if time.monotonic() < state["next_attempt"]:
+            state["status"] = "unhealthy"
+            return
+
+        state["status"] = "reconnecting"
+        log.warning("Server %s unhealthy (%s), reconnecting", server_name, error)
+        try:
+            await self.client.reconnect_server(server_name)
+        except Exception as e:
+            state["backoff"] = min(max(state["backoff"] * 2, self.min_backoff), self.max_backoff)
+            state["next_attempt"] = time.monotonic() + state["backoff"]
+            state["status"] = "unhealthy"
+            state["last_error"] = repr(e)
+            log.warning("Reconnect to %s failed, retrying in %.0fs: %r", server_name, state["backoff"], e)
+            return
+
+        state.update(status="healthy", failures=0, backoff=0.0, next_attempt=0.0, last_error=None)
+        state["reconnects"] += 1
+        log.info("Reconnected to server %s", server_name)
+
+    async def ping(self, server_name: str):
+        """Return None when the server answers a ping, otherwise a short error description"""
+        conn = self.client.connections.get(server_name)
+        if conn is None:
+            return "not connected"
+        if conn["task"].done():
+            return "transport closed"
+
+        started = time.perf_counter()
+        try:
+            if conn["type"] == "local":
+                await asyncio.wait_for(conn["session"].send_ping(), timeout=self.ping_timeout)
+            else:
+                results = await asyncio.wait_for(
+                    asyncio.gather(*(client.ping() for client in conn["clients"])),
+                    timeout=self.ping_timeout
+                )
+                if not all(results):
+                    return "ping rejected"
+        except asyncio.TimeoutError:
+            return "ping timed out"
+        except Exception as e:
+            if getattr(e, "code", None) != METHOD_NOT_FOUND:
+                return repr(e)
+
+        self.state(server_name)["last_ping_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return None
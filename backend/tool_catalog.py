@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import stat
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+log = logging.getLogger("gateway.catalog")
+
+NAMESPACE_SEPARATOR = "__"
+# Pseudo server that routes tools implemented by the gateway itself
+BUILTIN_SERVER = "gateway"
+NAMESPACING_MODES = ("never", "collisions", "always")
+# Anthropic tool names must match ^[a-zA-Z0-9_-]{1,64}$
+MAX_TOOL_NAME_LENGTH = 64
+
+
+class ToolCatalog:
+    """Cached view of the tools exposed by every connected MCP server"""
+
+    def __init__(self, ttl: float = 300.0, namespacing: str = "collisions"):
+        if namespacing not in NAMESPACING_MODES:
+            raise ValueError(f"Unknown tool namespacing mode {namespacing!r}, expected one of {NAMESPACING_MODES}")
+        self.ttl = ttl
+        self.namespacing = namespacing
+        self.server_tools: Dict[str, List[Any]] = {}
+        self.builtin_tools: List[Any] = []
+        self.tools: List[Any] = []
+        self.available_tools: List[Dict[str, Any]] = []
+        self.cacheable_tools: List[Dict[str, Any]] = []
+        self.tool_map: Dict[str, Any] = {}
+        self.tool_routes: Dict[str, Tuple[str, str]] = {}
+        self.collisions: Dict[str, List[str]] = {}
+        self.built_at = 0.0
+        self._stale_servers: Set[str] = set()
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def set_server_tools(self, server_name: str, tools: List[Any]):
+        """Store the tool list of one server and rebuild the derived views"""
+        self.server_tools[server_name] = list(tools)
+        self._stale_servers.discard(server_name)
+        self._rebuild()
+
+    def set_builtin_tools(self, tools: List[Any]):
+        """Advertise gateway tools after every server's tools; server tools win on name clashes"""
+        self.builtin_tools = list(tools)
+        self._rebuild()
+
+    def replace_servers(self, server_tools: Dict[str, List[Any]], removed: List[str] = ()):
+        """Swap in the tool lists of several servers and drop others with one rebuild, so no request sees half a reload"""
+        for server_name in removed:
+            self.server_tools.pop(server_name, None)
+            self._stale_servers.discard(server_name)
+        for server_name, tools in server_tools.items():
+            self.server_tools[server_name] = list(tools)
+            self._stale_servers.discard(server_name)
+        self._rebuild()
+
+    def remove_server(self, server_name: str):
+        """Drop a server and its tools from the catalog"""
+        self.server_tools.pop(server_name, None)
+        self._stale_servers.discard(server_name)
+        self._rebuild()
+
+    def invalidate(self, server_name: str = None):
+        """Mark one server (or every server) as needing a fresh list_tools"""
+        if server_name:
+            self._stale_servers.add(server_name)
+        else:
+            self._stale_servers.update(self.server_tools.keys())
+
+    def route(self, exposed_name: str) -> Optional[Tuple[str, str]]:
+        """Return (server, tool name on that server) for a tool name the model used"""
+        return self.tool_routes.get(exposed_name)
+
+    def exposed_name(self, server_name: str, tool_name: str, colliding: bool) -> str:
+        """Name a tool is advertised under, namespaced as server__tool when configured"""
+        if self.namespacing == "always" or (self.namespacing == "collisions" and colliding):
+            name = f"{server_name}{NAMESPACE_SEPARATOR}{tool_name}"
+            if len(name) > MAX_TOOL_NAME_LENGTH:
+                # A hash of the full name keeps two long names that share a prefix apart
+                digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+                name = f"{name[:MAX_TOOL_NAME_LENGTH - 9]}_{digest}"
+            return name
+        return tool_name
+
+    def is_stale(self) -> bool:
+        if self._stale_servers:
+            return True
+        return self.ttl > 0 and time.monotonic() - self.built_at > self.ttl
+
+    async def ensure_fresh(self, list_tools: Callable[[str], Awaitable[List[Any]]]):
+        """Start refreshing stale servers in the background; requests keep using the current catalog meanwhile"""
+        if not self.is_stale():
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            targets = list(self._stale_servers) or list(self.server_tools.keys())
+            self._refresh_task = asyncio.create_task(self.refresh(list_tools, targets))
+
+    async def refresh(self, list_tools: Callable[[str], Awaitable[List[Any]]], server_names: Optional[List[str]] = None):
+        """Re-fetch tools from the given servers (all by default), listing them concurrently"""
+        async with self._lock:
+            targets = server_names if server_names is not None else list(self.server_tools.keys())
+            results = await asyncio.gather(*(list_tools(srv_name) for srv_name in targets), return_exceptions=True)
+            for srv_name, result in zip(targets, results):
+                if isinstance(result, Exception):
+                    log.warning("Error getting tools from %s: %s", srv_name, result)
+                elif srv_name in self.server_tools:
+                    # A server removed while it was being listed stays removed
+                    self.server_tools[srv_name] = list(result)
+                self._stale_servers.discard(srv_name)
+            self._rebuild()
+
+    async def close(self):
+        """Stop a background refresh that is still running"""
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+
+    def _rebuild(self):
+        owners: Dict[str, List[str]] = {}
+        for srv_name, srv_tools in self.server_tools.items():
+            for tool in srv_tools:
+                if srv_name not in owners.setdefault(tool.name, []):
+                    owners[tool.name].append(srv_name)
+        collisions = {name: servers for name, servers in owners.items() if len(servers) > 1}
+
+        tools = []
+        available_tools = []
+        tool_map = {}
+        tool_routes = {}
+        for srv_name, srv_tools in list(self.server_tools.items()) + [(BUILTIN_SERVER, self.builtin_tools)]:
+            for tool in srv_tools:
+                name = self.exposed_name(srv_name, tool.name, tool.name in collisions) if srv_name != BUILTIN_SERVER else tool.name
+                if name in tool_routes:
+                    # Builtins yield to server tools, and "never" mode already reported its collisions
+                    if srv_name != BUILTIN_SERVER and not (self.namespacing == "never" and tool.name in collisions):
+                        log.warning("Dropping tool %s of %s: its name %s is already taken by %s",
+                                    tool.name, srv_name, name, tool_routes[name][0])
+                    continue
+                tools.append(tool)
+                available_tools.append({
+                    "name": name,
+                    "description": tool.description,
+                    "input_schema": tool.inputSchema
+                })
+                tool_map[name] = tool
+                tool_routes[name] = (srv_name, tool.name)
+
+        for name, servers in collisions.items():
+            if self.collisions.get(name) != servers:
+                if self.namespacing == "never":
+                    log.warning("Tool %s is exposed by %s; routing it to %s", name, servers, servers[0])
+                else:
+                    aliases = [self.exposed_name(server, name, True) for server in servers]
+                    log.info("Tool %s is exposed by %s; advertising it as %s", name, servers, aliases)
+
+        self.tools = tools
+        self.available_tools = available_tools
+        self.cacheable_tools = available_tools[:-1] + [
+            dict(tool, cache_control={"type": "ephemeral"}) for tool in available_tools[-1:]
+        ]
+        self.tool_map = tool_map
+        self.tool_routes = tool_routes
+        self.collisions = collisions
+        self.built_at = time.monotonic()
+
+
+def tool_to_dict(tool: Any) -> Dict[str, Any]:
+    """Serialize the parts of an MCP tool the catalog needs"""
+    annotations = getattr(tool, "annotations", None)
+    if annotations is not None and hasattr(annotations, "model_dump"):
+        annotations = annotations.model_dump(exclude_none=True)
+    return {
+        "name": tool.name,
+        "description": tool.description,
+        "inputSchema": tool.inputSchema,
+        "annotations": annotations
+    }
+
+
+def tool_from_dict(data: Dict[str, Any]) -> SimpleNamespace:
+    """Rebuild a tool-like object from tool_to_dict output"""
+    annotations = data.get("annotations")
+    return SimpleNamespace(
+        name=data["name"],
+        description=data.get("description"),
+        inputSchema=data.get("inputSchema", {"type": "object"}),
+        annotations=SimpleNamespace(**annotations) if annotations else None
+    )
+
+
+def load_tool_cache(path: str) -> Dict[str, List[SimpleNamespace]]:
+    """Load tool lists remembered from earlier runs, keyed by server argument"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {spec: [tool_from_dict(tool) for tool in tools] for spec, tools in data.items()}
+    except (OSError, ValueError, KeyError) as e:
+        log.warning("Ignoring unreadable tool cache %s: %s", path, e)
+        return {}
+
+
+def save_tool_cache(path: str, cache: Dict[str, List[Any]]):
+    """Persist tool lists so lazy servers can be advertised without connecting"""
+    if not path:
+        return
+    try:
+        if not stat.S_ISREG(os.stat(path).st_mode):
+            log.warning("Not writing tool cache over %s, which is not a regular file", path)
+            return
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        log.warning("Could not write tool cache %s: %s", path, e)
+        return
+
+    data = {spec: [tool_to_dict(tool) for tool in tools] for spec, tools in cache.items()}
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=".tool-cache-", suffix=".tmp", dir=os.path.dirname(path) or ".")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning("Could not write tool cache %s: %s", path, e)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
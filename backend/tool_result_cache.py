@@ -0,0 +1,95 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+def canonical_input(tool_input: Any) -> str:
+    """Stable JSON form of tool arguments, independent of key order"""
+    return json.dumps(tool_input or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def parse_cacheable_tools(spec: str, default_ttl: float) -> Dict[str, float]:
+    """Parse "git_status,git_log=120,server_1__search=10" into {name: ttl}"""
+    tools = {}
+    for entry in (spec or "").split(","):
+        name, _, ttl = entry.strip().partition("=")
+        if name:
+            tools[name] = float(ttl) if ttl else default_ttl
+    return tools
+
+
+class ToolResultCache:
+    """Opt-in TTL + LRU cache of tool results with single-flight de-duplication of identical calls"""
+
+    def __init__(self, cacheable_tools: Dict[str, float] = None, max_entries: int = 256):
+        self.cacheable_tools = dict(cacheable_tools or {})
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+        self.in_flight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def ttl_for(self, server_name: str, tool_name: str) -> Optional[float]:
+        """TTL configured for a tool (by server__tool or plain name), None when it is not cacheable"""
+        ttl = self.cacheable_tools.get(f"{server_name}__{tool_name}")
+        if ttl is None:
+            ttl = self.cacheable_tools.get(tool_name)
+        return ttl if ttl and ttl > 0 and self.max_entries > 0 else None
+
+    def counters(self, server_name: str, tool_name: str) -> Dict[str, int]:
+        return self.stats.setdefault(f"{server_name}__{tool_name}", {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0})
+
+    async def call(self, server_name: str, tool_name: str, tool_input: Any,
+                   fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return a cached result for the call, or run fetch() once for all identical concurrent callers"""
+        ttl = self.ttl_for(server_name, tool_name)
+        if ttl is None:
+            return await fetch()
+
+        key = (server_name, tool_name, canonical_input(tool_input))
+        counters = self.counters(server_name, tool_name)
+        cached = self.entries.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if time.monotonic() < expires_at:
+                self.entries.move_to_end(key)
+                counters["hits"] += 1
+                return result
+            del self.entries[key]
+
+        pending = self.in_flight.get(key)
+        if pending is not None:
+            counters["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        counters["misses"] += 1
+        pending = asyncio.ensure_future(fetch())
+        self.in_flight[key] = pending
+        pending.add_done_callback(lambda done: self._store(key, ttl, done, counters))
+        return await asyncio.shield(pending)
+
+    def _store(self, key: Tuple[str, str, str], ttl: float, done: asyncio.Future, counters: Dict[str, int]):
+        self.in_flight.pop(key, None)
+        if done.cancelled() or done.exception() is not None:
+            return
+        result = done.result()
+        if getattr(result, "isError", False):
+            return
+        self.entries[key] = (time.monotonic() + ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            self.counters(evicted[0], evicted[1])["evictions"] += 1
+
+    def invalidate(self, server_name: str = None):
+        """Drop cached results of one server (or of every server)"""
+        for key in [key for key in self.entries if server_name is None or key[0] == server_name]:
+            del self.entries[key]
+
+    def summary(self) -> Dict[str, Any]:
+        totals = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        for counters in self.stats.values():
+            for name in totals:
+                totals[name] += counters[name]
+        return dict(totals, entries=len(self.entries), tools=self.stats)
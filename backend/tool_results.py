@@ -0,0 +1,239 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+log = logging.getLogger("gateway.results")
+
+READ_RESULT_TOOL = "read_tool_result"
+TRUNCATION_MODES = ("head", "tail", "head_tail")
+# Image formats the Messages API accepts inside tool results
+IMAGE_MEDIA_TYPES = ("image/jpeg", "image/png", "image/gif", "image/webp")
+
+READ_RESULT_TOOL_SPEC = {
+    "name": READ_RESULT_TOOL,
+    "description": "Read part of a tool result that was too large to include in full. "
+                   "Truncated results name their handle and total length.",
+    "inputSchema": {
+        "type": "object",
+        "properties": {
+            "handle": {"type": "string", "description": "Handle from the truncation notice, e.g. res_1a2b3c4d5e6f7a8b"},
+            "offset": {"type": "integer", "description": "Character offset to start reading at", "default": 0},
+            "length": {"type": "integer", "description": "Number of characters to read"}
+        },
+        "required": ["handle"]
+    },
+}
+
+
+def parse_result_limits(spec: str, default_mode: str = "head_tail") -> Dict[str, Tuple[int, str]]:
+    """Parse "git_diff=50000,pytest=8000:tail,server_1__search=0" into {name: (max_chars, mode)}"""
+    limits = {}
+    for entry in (spec or "").split(","):
+        name, _, limit = entry.strip().partition("=")
+        if not name or not limit:
+            continue
+        chars, _, mode = limit.partition(":")
+        mode = mode or default_mode
+        if mode not in TRUNCATION_MODES:
+            raise ValueError(f"Unknown truncation mode {mode!r} for {name}, expected one of {TRUNCATION_MODES}")
+        limits[name] = (int(chars), mode)
+    return limits
+
+
+def content_block(item: Any, max_image_bytes: int) -> Dict[str, Any]:
+    """Convert one MCP content item into a Messages API content block"""
+    kind = getattr(item, "type", None)
+    if kind == "text":
+        return {"type": "text", "text": item.text}
+    if kind == "image":
+        media_type = getattr(item, "mimeType", "")
+        # base64 carries 3 bytes in 4 characters
+        size = len(item.data) * 3 // 4
+        if media_type in IMAGE_MEDIA_TYPES and size <= max_image_bytes:
+            return {"type": "image", "source": {"type": "base64", "media_type": media_type, "data": item.data}}
+        return {"type": "text", "text": f"[{media_type or 'unknown'} image of {size} bytes omitted]"}
+    if kind == "audio":
+        return {"type": "text", "text": f"[{getattr(item, 'mimeType', 'audio')} audio of {len(item.data) * 3 // 4} bytes omitted]"}
+    if kind == "resource":
+        resource = item.resource
+        text = getattr(resource, "text", None)
+        if text is not None:
+            return {"type": "text", "text": f"[resource {resource.uri}]\n{text}"}
+        return {"type": "text", "text": f"[binary resource {resource.uri} ({getattr(resource, 'mimeType', None) or 'unknown type'}) omitted]"}
+    if kind == "resource_link":
+        return {"type": "text", "text": f"[resource link {getattr(item, 'name', '')} {item.uri}]"}
+    return {"type": "text", "text": item if isinstance(item, str) else str(item)}
+
+
+def result_items(result: Any) -> Tuple[List[Any], bool]:
+    """Content items and error flag of a call_tool result from either an MCP session or a FastMCP client"""
+    if isinstance(result, (list, tuple)):
+        return list(result), False
+    content = getattr(result, "content", None)
+    if content is None:
+        return [result], False
+    is_error = bool(getattr(result, "is_error", None) or getattr(result, "isError", False))
+    items = content if isinstance(content, list) else [content]
+    if not items:
+        structured = getattr(result, "structured_content", None) or getattr(result, "structuredContent", None)
+        if structured is not None:
+            items = [str(structured)]
+    return items, is_error
+
+
+def mentions_stored_result(messages: List[Dict[str, Any]]) -> bool:
+    """Whether a tool result in the conversation points at a stored result the model may want to read"""
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list) and any(
+            isinstance(block, dict) and block.get("type") == "tool_result" and READ_RESULT_TOOL in str(block.get("content"))
+            for block in content
+        ):
+            return True
+    return False
+
+
+def truncate(text: str, max_chars: int, mode: str, notice: str) -> str:
+    """Cut text to about max_chars, keeping its head, its tail or both around the notice"""
+    if mode == "head":
+        return text[:max_chars] + notice
+    if mode == "tail":
+        return notice + text[-max_chars:]
+    head = max_chars * 2 // 3
+    return text[:head] + notice + text[len(text) - (max_chars - head):]
+
+
+class ToolResultStore:
+    """Full text of oversized tool results, kept in temp files by content handle and evicted LRU by total size"""
+
+    def __init__(self, directory: str = None, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.owns_directory = directory is None
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self.total_bytes = 0
+
+    def put(self, text: str) -> str:
+        """Store text and return its handle; identical results share one handle"""
+        data = text.encode("utf-8")
+        handle = "res_" + hashlib.sha256(data).hexdigest()[:16]
+        if handle in self.entries:
+            self.entries.move_to_end(handle)
+            return handle
+
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="mcp-tool-results-")
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, handle + ".txt")
+        with open(path, "wb") as f:
+            f.write(data)
+        self.entries[handle] = (path, len(data))
+        self.total_bytes += len(data)
+
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            evicted, (old_path, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+            log.debug("Evicted stored tool result %s", evicted)
+        return handle
+
+    def read(self, handle: str, offset: int = 0, length: int = None) -> Optional[Tuple[str, int]]:
+        """Return (slice of the stored text, total length), or None for unknown or evicted handles"""
+        entry = self.entries.get(handle)
+        if entry is None:
+            return None
+        try:
+            with open(entry[0], "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return None
+        self.entries.move_to_end(handle)
+        end = len(text) if length is None else offset + length
+        return text[offset:end], len(text)
+
+    def close(self):
+        """Delete stored results, and the directory when the store created it"""
+        for path, _ in self.entries.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.entries.clear()
+        self.total_bytes = 0
+        if self.owns_directory and self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+class ToolResultNormalizer:
+    """Turns any call_tool result into tool_result content, capping its text per tool and its images per result"""
+
+    def __init__(self, max_chars: int = 20000, limits: Dict[str, Tuple[int, str]] = None, mode: str = "head_tail",
+                 store: ToolResultStore = None, max_image_bytes: int = 5 * 1024 * 1024, max_images: int = 4):
+        if mode not in TRUNCATION_MODES:
+            raise ValueError(f"Unknown truncation mode {mode!r}, expected one of {TRUNCATION_MODES}")
+        self.max_chars = max_chars
+        self.limits = dict(limits or {})
+        self.mode = mode
+        self.store = store
+        self.max_image_bytes = max_image_bytes
+        self.max_images = max_images
+
+    def limit_for(self, server_name: str, tool_name: str) -> Tuple[int, str]:
+        """(max_chars, mode) for a tool, by server__tool or plain name; 0 means no cap"""
+        limit = self.limits.get(f"{server_name}__{tool_name}") or self.limits.get(tool_name)
+        return limit if limit else (self.max_chars, self.mode)
+
+    def normalize(self, server_name: str, tool_name: str, result: Any) -> Tuple[Union[str, List[Dict[str, Any]]], bool, bool]:
+        """Return (content, is_error, truncated); content is a string unless the result holds images"""
+        items, is_error = result_items(result)
+        blocks = [content_block(item, self.max_image_bytes) for item in items]
+        text = "\n".join(block["text"] for block in blocks if block["type"] == "text")
+        images = [block for block in blocks if block["type"] != "text"]
+
+        max_chars, mode = self.limit_for(server_name, tool_name)
+        truncated = 0 < max_chars < len(text)
+        if truncated:
+            total = len(text)
+            handle = self.store.put(text) if self.store else None
+            if handle:
+                notice = (f"\n[... {total - max_chars} of {total} characters omitted. "
+                          f"Call {READ_RESULT_TOOL} with handle {handle} to read them ...]\n")
+            else:
+                notice = f"\n[... {total - max_chars} of {total} characters omitted ...]\n"
+            text = truncate(text, max_chars, mode, notice)
+            log.info("Truncated %s result from %s to %s characters", tool_name, total, max_chars)
+
+        if len(images) > self.max_images:
+            omitted = len(images) - self.max_images
+            images = images[:self.max_images]
+            text += f"\n[{omitted} more image{'s' if omitted > 1 else ''} omitted]"
+            truncated = True
+
+        if not images:
+            return text, is_error, truncated
+        return ([{"type": "text", "text": text}] if text else []) + images, is_error, truncated
+
+    def read(self, tool_input: Dict[str, Any]) -> Tuple[str, bool]:
+        """Serve a read_tool_result call; returns (text, is_error)"""
+        if self.store is None:
+            return "Error: stored tool results are disabled", True
+        handle = str(tool_input.get("handle", ""))
+        offset = max(int(tool_input.get("offset") or 0), 0)
+        length = int(tool_input.get("length") or self.max_chars or 20000)
+        if self.max_chars:
+            length = min(length, self.max_chars)
+        stored = self.store.read(handle, offset, max(length, 1))
+        if stored is None:
+            return f"Error: unknown or expired result handle {handle}", True
+        text, total = stored
+        end = offset + len(text)
+        footer = f"\n[characters {offset}-{end} of {total}" + ("]" if end >= total else f"; continue at offset {end}]")
+        return text + footer, False
@@ -16,6 +16,7 @@ function Chat:new(width, height, sideBarWidth, db, font)
     self.font = font
 
     self.messages = {}
+    self.streamingMessages = {}
     self.chatName = ""
     self.scrollOffset = 0
 
@@ -44,6 +45,48 @@ function Chat:addMessage(sender, content)
     self:scrollToBottom()
 end
 
+function Chat:appendStreamingText(requestId, text)
+    local message = self.streamingMessages[requestId]
+    if not message then
+        message = {sender = "Assistant", content = ""}
+        table.insert(self.messages, message)
+        self.streamingMessages[requestId] = message
+    end
+
+    message.content = message.content .. text
+    self:scrollToBottom()
+end
+
+function Chat:finishStreamingMessage(requestId, content)
+    local message = requestId ~= nil and self.streamingMessages[requestId]
+    if not message then
+        self:addMessage("Assistant", content)
+        return
+    end
+
+    self.streamingMessages[requestId] = nil
+    message.content = content
+
+    if not self.newChat and self.chatName and self.chatName ~= "" then
+        self:saveMessagesToDatabase()
+    end
+
+    self:scrollToBottom()
+end
+
+function Chat:discardStreamingMessage(requestId)
+    local message = requestId ~= nil and self.streamingMessages[requestId]
+    if not message then return end
+
+    self.streamingMessages[requestId] = nil
+    for i = #self.messages, 1, -1 do
+        if self.messages[i] == message then
+            table.remove(self.messages, i)
+            break
+        end
+    end
+end
+
 function Chat:saveMessagesToDatabase()
     if self.chatName and self.chatName ~= "" then
         local success, error_msg = self.db:Update(self.chatName, self.messages)
@@ -267,13 +310,17 @@ function Chat:sendMessage(message)
             self.newChat = false
 
             local totalChats = #self.db:GetAllKeys() + 1
+            while self.db:Exists("chat" .. totalChats) do
+                totalChats = totalChats + 1
+            end
             self.chatName = "chat" .. totalChats
             self.db:Create(self.chatName, "")
+            networkManager:newConversation(self.chatName)
             self.messages = {}
         end
 
         self:addMessage("You", message)
-        networkManager:sendMessage(message)
+        networkManager:sendMessage(message, self.chatName)
 
         self.queryInput.text = ""
         self.queryInput.cursorPos = 0
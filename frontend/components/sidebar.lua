@@ -53,6 +53,7 @@ function Sidebar:draw(width, height, sideBarWidth)
             self.chat.chatName = key
             self.chat.newChat = false
             self.chat.messages = self.db:Read(key) or {}
+            networkManager:resume(key)
         end)
 
         table.insert(self.chatButtons, chatButton)
@@ -90,8 +91,13 @@ function Sidebar:mousepressed(x, y, button)
             if math.sqrt(dx * dx + dy * dy) <= btn.r then
                 print("Eliminar chat:", btn.chatKey)
                 self.db:Delete(btn.chatKey)
+                networkManager:forgetConversation(btn.chatKey)
                 self.selectedChat = nil
                 self.chat.messages = {}
+                if self.chat.chatName == btn.chatKey then
+                    self.chat.newChat = true
+                    self.chat.chatName = ""
+                end
             end
         end
     end
@@ -9,12 +9,71 @@ function NetworkManager:new()
     self.reconnectInterval = 5
     self.responseBuffer = ""
     self.pendingMessages = {}
+    self.inFlight = {}
+    self.interrupted = {}
+    self.recovering = 0
+    self.nextRequestId = 1
     self.waitingForResponse = false
-    self.lastMessageTime = 0
     self.responseTimeout = 30
+    self.streamResponses = true
+    self.clientId = self:loadClientId()
+    self.conversationIds = self:loadConversationIds()
+    self.cursors = {}
     self.debugMode = false
 end
 
+function NetworkManager:loadClientId()
+    local file = "client_id"
+    local id = love.filesystem.read(file)
+    if id and id ~= "" then
+        return id
+    end
+
+    id = string.format("%08x%08x", love.math.random(0, 0x7fffffff), os.time())
+    love.filesystem.write(file, id)
+    return id
+end
+
+function NetworkManager:loadConversationIds()
+    local content = love.filesystem.read("conversation_ids.json")
+    if content and content ~= "" then
+        local ids, _, err = json.decode(content)
+        if not err and type(ids) == "table" then
+            return ids
+        end
+    end
+    return {}
+end
+
+function NetworkManager:saveConversationIds()
+    love.filesystem.write("conversation_ids.json", json.encode(self.conversationIds, { indent = true }))
+end
+
+function NetworkManager:newConversation(chatName)
+    local id = string.format("%s:%08x%08x", self.clientId, love.math.random(0, 0x7fffffff), os.time())
+    self.conversationIds[chatName] = id
+    self:saveConversationIds()
+    return id
+end
+
+function NetworkManager:forgetConversation(chatName)
+    local id = self.conversationIds[chatName]
+    if id then
+        self.cursors[id] = nil
+        self.conversationIds[chatName] = nil
+        self:saveConversationIds()
+    end
+    self.interrupted[chatName] = nil
+end
+
+function NetworkManager:conversationIdFor(chatName)
+    if not chatName or chatName == "" then
+        return nil
+    end
+    -- Chat names are reused after a delete, so each chat gets its own id instead of one derived from its name
+    return self.conversationIds[chatName] or self:newConversation(chatName)
+end
+
 function NetworkManager:connect()
     if self.debugMode then
         print("Trying to connect to " .. self.host .. ":" .. self.port)
@@ -33,6 +92,16 @@ function NetworkManager:connect()
         if self.debugMode then
             print("Connected to MCP server!")
         end
+        local interrupted = self.interrupted
+        local resumed = false
+        self.interrupted = {}
+        for chatName, queries in pairs(interrupted) do
+            self:recover(chatName, queries)
+            resumed = resumed or (chat and chat.chatName == chatName)
+        end
+        if chat and not resumed then
+            self:resume(chat.chatName)
+        end
         return true
     else
         if self.debugMode then
@@ -58,15 +127,21 @@ function NetworkManager:update(dt)
 
     if self.waitingForResponse then
         local currentTime = os.clock()
-        if currentTime - self.lastMessageTime > self.responseTimeout then
-            if self.debugMode then
-                print("Response timeout")
-            end
-            self.waitingForResponse = false
-            if chat then
-                chat:addMessage("System", "Timeout: No response from server")
+        for id, request in pairs(self.inFlight) do
+            if currentTime - request.sentAt > self.responseTimeout then
+                if self.debugMode then
+                    print("Response timeout for request", id)
+                end
+                self.inFlight[id] = nil
+                if request.recover then
+                    self.recovering = self.recovering - 1
+                end
+                if chat then
+                    chat:addMessage("System", "Timeout: No response from server")
+                end
             end
         end
+        self.waitingForResponse = next(self.inFlight) ~= nil
     end
 
     self:receiveData()
@@ -99,7 +174,7 @@ function NetworkManager:receiveData()
         end
         self.isConnected = false
         self.client = nil
-        self.waitingForResponse = false
+        self:interruptInFlight()
     elseif err == "timeout" then
     elseif err then
         if self.debugMode then
@@ -135,13 +210,45 @@ function NetworkManager:handleResponse(responseData)
     if self.debugMode then
         print("Handling response:", responseData)
     end
-    self.waitingForResponse = false
 
     local success, response = pcall(function()
         return json.decode(responseData)
     end)
 
     if success and response and type(response) == "table" then
+        if response.event == "text_delta" then
+            if self.inFlight[response.id] then
+                self.inFlight[response.id].sentAt = os.clock()
+            end
+            if chat then
+                chat:appendStreamingText(response.id, response.text or "")
+            end
+            return
+        elseif response.event == "tool_call" then
+            if self.debugMode then
+                print("Tool call " .. tostring(response.name) .. ": " .. tostring(response.status))
+            end
+            if self.inFlight[response.id] then
+                self.inFlight[response.id].sentAt = os.clock()
+            end
+            return
+        end
+
+        local request = nil
+        if response.id ~= nil then
+            request = self.inFlight[response.id]
+            self.inFlight[response.id] = nil
+        end
+        self.waitingForResponse = next(self.inFlight) ~= nil
+
+        if response.conversation_id and response.cursor then
+            self.cursors[response.conversation_id] = response.cursor
+        end
+        if request and request.kind == "resume" then
+            self:handleResume(request, response)
+            return
+        end
+
         if self.debugMode then
             print("JSON parsed successfully - Status:", response.status, "Data:", response.data, "Error:", response.error)
         end
@@ -152,7 +259,7 @@ function NetworkManager:handleResponse(responseData)
                 print("Success response, adding to chat:", data)
             end
             if chat then
-                chat:addMessage("Assistant", tostring(data))
+                chat:finishStreamingMessage(response.id, tostring(data))
             end
         elseif response.status == "error" then
             local error = response.error or "Unknown error"
@@ -160,6 +267,7 @@ function NetworkManager:handleResponse(responseData)
                 print("Error response:", error)
             end
             if chat then
+                chat:discardStreamingMessage(response.id)
                 chat:addMessage("Error", "Error: " .. tostring(error))
             end
         else
@@ -176,56 +284,228 @@ function NetworkManager:handleResponse(responseData)
             print("Parse error - success:", success, "response type:", type(response))
         end
 
+        self.waitingForResponse = next(self.inFlight) ~= nil
         if chat then
             chat:addMessage("Assistant", tostring(responseData))
         end
     end
 end
 
-function NetworkManager:sendMessage(message)
+function NetworkManager:handleResume(request, response)
+    if response.status ~= "success" or type(response.data) ~= "table" then
+        if self.debugMode then
+            print("Resume failed:", response.error)
+        end
+        if request.recover then
+            self.recovering = self.recovering - 1
+            if chat and chat.chatName == request.chatName then
+                chat:addMessage("System", "Could not check whether " .. #request.recover ..
+                    " message(s) reached the server before the connection dropped; they were not sent again")
+            end
+        end
+        return
+    end
+
+    local resumed = response.data
+    if not resumed.known then
+        self.cursors[resumed.conversation_id] = nil
+    end
+
+    local received = {}
+    if request.recover then
+        -- Only queries the gateway never stored are sent again; the others may already have run tools
+        self.recovering = self.recovering - 1
+        received = self:matchRecovered(request.recover, resumed.messages or {})
+        for i = #request.recover, 1, -1 do
+            if not received[i] then
+                table.insert(self.pendingMessages, 1, request.recover[i])
+            end
+        end
+    end
+
+    if not chat or chat.chatName ~= request.chatName then
+        return
+    end
+
+    local shown = request.shownCursor or request.cursor
+    for _, message in ipairs(resumed.messages or {}) do
+        if message.role == "assistant" and type(message.content) == "table" and (message.seq or shown) >= shown then
+            for _, block in ipairs(message.content) do
+                if block.type == "text" and block.text and block.text ~= "" then
+                    chat:addMessage("Assistant", block.text)
+                end
+            end
+        end
+    end
+
+    local count = 0
+    for _ in pairs(received) do
+        count = count + 1
+    end
+    if count > 0 then
+        chat:addMessage("System", count .. " message(s) reached the server before the connection dropped" ..
+            " and were not sent again; their answers, if any, are shown above")
+    end
+end
+
+function NetworkManager:matchRecovered(queries, messages)
+    -- Walk both lists backwards so a repeated question matches its most recent copy
+    local received = {}
+    local last = #messages
+    for i = #queries, 1, -1 do
+        local k = last
+        while k >= 1 and not (messages[k].role == "user" and messages[k].content == queries[i].query) do
+            k = k - 1
+        end
+        if k >= 1 then
+            received[i] = true
+            last = k - 1
+        end
+    end
+    return received
+end
+
+function NetworkManager:sendMessage(message, chatName)
+    return self:sendRequest({ kind = "query", query = message, chatName = chatName })
+end
+
+function NetworkManager:resume(chatName)
+    local conversationId = self:conversationIdFor(chatName)
+    local cursor = conversationId and self.cursors[conversationId]
+    if not cursor then
+        return false
+    end
+    return self:sendRequest({ kind = "resume", chatName = chatName, cursor = cursor })
+end
+
+function NetworkManager:recover(chatName, queries)
+    local shownCursor = self.cursors[self:conversationIdFor(chatName)] or 0
+    local cursor = shownCursor
+    for _, request in ipairs(queries) do
+        cursor = math.min(cursor, request.cursor or 0)
+    end
+    if self:sendRequest({ kind = "resume", chatName = chatName, cursor = cursor,
+                          shownCursor = shownCursor, recover = queries }) then
+        self.recovering = self.recovering + 1
+    end
+end
+
+function NetworkManager:buildFrame(id, request)
+    local frame = { id = id, conversation_id = self:conversationIdFor(request.chatName) }
+    if request.kind == "resume" then
+        frame.type = "resume"
+        frame.cursor = request.cursor
+    else
+        frame.query = request.query
+        frame.stream = self.streamResponses
+    end
+    return json.encode(frame) .. "\n"
+end
+
+function NetworkManager:sendRequest(request, fromQueue)
     if self.debugMode then
-        print("Attempting to send message:", message)
+        print("Attempting to send " .. request.kind .. ":", request.query)
     end
 
     if not self.isConnected then
-        table.insert(self.pendingMessages, message)
-        if self.debugMode then
-            print("Message queued (not connected):", message)
+        if request.kind == "query" then
+            table.insert(self.pendingMessages, request)
+            if self.debugMode then
+                print("Message queued (not connected):", request.query)
+            end
+        elseif request.recover then
+            self:addInterrupted(request.chatName, request.recover)
         end
         return false
     end
 
-    local messageWithNewline = message .. "\n"
-    local success, err = self.client:send(messageWithNewline)
+    local id = self.nextRequestId
+    if request.kind == "query" then
+        request.cursor = self.cursors[self:conversationIdFor(request.chatName)] or 0
+    end
+    local success, err = self:sendFrame(self:buildFrame(id, request))
 
     if success then
         if self.debugMode then
-            print("Message sent successfully:", message)
+            print("Request sent successfully:", request.query)
         end
+        self.nextRequestId = id + 1
+        request.sentAt = os.clock()
+        self.inFlight[id] = request
         self.waitingForResponse = true
-        self.lastMessageTime = os.clock()
         return true
     else
         if self.debugMode then
-            print("Failed to send message:", err)
+            print("Failed to send request:", err)
         end
         self.isConnected = false
-        self.waitingForResponse = false
-        table.insert(self.pendingMessages, message)
+        if request.kind == "query" then
+            table.insert(self.pendingMessages, fromQueue and 1 or #self.pendingMessages + 1, request)
+        elseif request.recover then
+            self:addInterrupted(request.chatName, request.recover)
+        end
+        self:interruptInFlight()
         return false
     end
 end
 
+function NetworkManager:sendFrame(frame)
+    local sent = 0
+    while sent < #frame do
+        local last, err, partialLast = self.client:send(frame, sent + 1)
+        if last then
+            sent = last
+        elseif err == "timeout" then
+            sent = partialLast
+        else
+            return false, err
+        end
+    end
+    return true
+end
+
+function NetworkManager:interruptInFlight()
+    -- The gateway may already have run these queries; they are checked against the resumed history
+    -- after reconnecting instead of being sent again blindly
+    local ids = {}
+    for id in pairs(self.inFlight) do
+        table.insert(ids, id)
+    end
+    table.sort(ids)
+    for _, id in ipairs(ids) do
+        local request = self.inFlight[id]
+        if request.kind == "query" then
+            self:addInterrupted(request.chatName, { request })
+            if chat then
+                chat:discardStreamingMessage(id)
+            end
+        elseif request.recover then
+            self:addInterrupted(request.chatName, request.recover)
+        end
+    end
+    self.inFlight = {}
+    self.waitingForResponse = false
+    self.recovering = 0
+end
+
+function NetworkManager:addInterrupted(chatName, requests)
+    local queries = self.interrupted[chatName] or {}
+    for _, request in ipairs(requests) do
+        table.insert(queries, request)
+    end
+    self.interrupted[chatName] = queries
+end
+
 function NetworkManager:sendPendingMessages()
-    if not self.isConnected then return end
+    -- Interrupted queries go back to the front of the queue once recovered, so wait for them
+    if not self.isConnected or self.recovering > 0 then return end
 
     while #self.pendingMessages > 0 do
-        local message = table.remove(self.pendingMessages, 1)
+        local request = table.remove(self.pendingMessages, 1)
         if self.debugMode then
-            print("Sending pending message:", message)
+            print("Sending pending message:", request.query)
         end
-        if not self:sendMessage(message) then
-            table.insert(self.pendingMessages, 1, message)
+        if not self:sendRequest(request, true) then
             break
         end
     end
@@ -258,6 +538,7 @@ function NetworkManager:close()
         self.client = nil
     end
     self.isConnected = false
+    self.inFlight = {}
     self.waitingForResponse = false
 end
 